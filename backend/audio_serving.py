@@ -0,0 +1,187 @@
+"""
+HTTP serving of audio files: conditional requests, byte ranges and in-progress synthesis
+"""
+import os
+import re
+import asyncio
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from tts import find_audio, is_content_addressed, synthesis_in_progress
+
+CHUNK_SIZE = 64 * 1024
+TAIL_POLL_INTERVAL = 0.05  # Seconds between reads of a file that is still being synthesized
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Expose-Headers": "*"
+}
+
+
+def audio_etag(file_name: str, stat: os.stat_result) -> str:
+    """Strong ETag: the content hash for content-addressed files, else mtime and size"""
+    if is_content_addressed(file_name):
+        return f'"{file_name[:-len(".mp3")]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since when it is absent"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header
+
+    Args:
+        header: Value of the Range header
+        size: Size of the file in bytes
+
+    Returns:
+        (start, end) inclusive, or None when the header should be ignored (malformed or multi-range)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def range_applies(request: Request, etag: str, last_modified: str) -> bool:
+    """A Range is only honoured if If-Range, when sent, still matches the file"""
+    if_range = request.headers.get("if-range")
+    return if_range is None or if_range.strip() in (etag, last_modified)
+
+
+async def read_file(path: str, start: int, length: int):
+    """Yield length bytes of path from start, reading off the event loop"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def tail_synthesis(file_name: str, tmp_path: str, f):
+    """Yield an open temp file's bytes as synthesis appends them, until the synthesis finishes"""
+    # The open descriptor survives the rename to the final name, so nothing is missed
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif synthesis_in_progress(file_name) == tmp_path:
+                await asyncio.sleep(TAIL_POLL_INTERVAL)
+            else:
+                # Finished: drain whatever was written after the last read
+                while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                    yield chunk
+                return
+    finally:
+        f.close()
+
+
+def serve_audio(request: Request, file_name: str) -> Response:
+    """
+    Build the response for GET /audio/{file_name}
+
+    Complete files get ETag/Last-Modified validators, 304s and single byte ranges.
+    A content-addressed file that is still being synthesized is streamed as it grows.
+    """
+    file_name = os.path.basename(file_name)
+    media_type = "audio/mpeg" if file_name.endswith(".mp3") else "audio/wav"
+
+    full_path = find_audio(file_name)
+    tmp_path = synthesis_in_progress(file_name) if full_path is None else None
+    if tmp_path:
+        try:
+            f = open(tmp_path, "rb")
+        except OSError:
+            # Synthesis finished (or failed) between the lookup and the open
+            full_path = find_audio(file_name)
+        else:
+            return StreamingResponse(
+                tail_synthesis(file_name, tmp_path, f),
+                media_type=media_type,
+                headers={"Cache-Control": "no-store", **CORS_HEADERS}
+            )
+
+    try:
+        stat = os.stat(full_path) if full_path else None
+    except OSError:
+        stat = None
+    if stat is None:
+        return JSONResponse(status_code=404, content={"error": "File not found"}, headers=CORS_HEADERS)
+
+    etag = audio_etag(file_name, stat)
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "Accept-Ranges": "bytes",
+        # Content-addressed files never change, so browsers can keep them forever
+        "Cache-Control": "public, max-age=31536000, immutable" if is_content_addressed(file_name) else "no-cache",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        **CORS_HEADERS
+    }
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if range_header and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{stat.st_size}"}
+            )
+        if byte_range:
+            start, end = byte_range
+            return StreamingResponse(
+                read_file(full_path, start, end - start + 1),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                    "Content-Length": str(end - start + 1)
+                }
+            )
+
+    return FileResponse(full_path, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,297 @@
+"""
+End-to-end benchmark for the Explain Like I'm 10 API
+
+By default the app runs in-process against the fake LLM and TTS backends, in a temporary
+working directory, so results are reproducible and independent of caches from earlier runs:
+
+    python benchmark.py --concurrency 1,4,16 --requests 32 --output results.json
+    python benchmark.py --compare results.json      # compare a new run against an old one
+    python benchmark.py --standin-backends 3        # real Ollama client against a pool of stand-in servers
+
+Prompt prefix reuse can be compared the same way, with prefill modelled by the fake LLM:
+
+    FAKE_LLM_PREFILL_TOKENS_PER_SEC=500 python benchmark.py --scenarios explain_stream --output separate.json
+    FAKE_LLM_PREFILL_TOKENS_PER_SEC=500 PROMPT_REUSE=1 python benchmark.py --scenarios explain_stream --compare separate.json
+
+Pass --url to benchmark an already running server (with whatever backend it uses) instead.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("explain", "explain_stream", "quiz_generate", "quiz_evaluate")
+BASE_TOPICS = ["Gravity", "Plants", "Weather", "Computers", "Fractions", "Money", "Robots", "Time"]
+
+
+def percentiles(values: list) -> dict:
+    """Summarize a list of seconds as p50/p95/p99/mean in milliseconds"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+    return {
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 1)
+    }
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process (server included when running in-process)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_server(port: int, app=None) -> threading.Thread:
+    """Run the app (by default the API) with uvicorn in a background thread of this process"""
+    import uvicorn
+    if app is None:
+        from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return thread
+
+
+def thread_cpu_clock(thread: threading.Thread):
+    """Return a function reading the CPU seconds used by one thread, or None where unsupported"""
+    try:
+        clock_id = time.pthread_getcpuclockid(thread.ident)
+        time.clock_gettime(clock_id)
+    except (AttributeError, OSError):
+        return None
+    return lambda: time.clock_gettime(clock_id)
+
+
+async def run_request(client, scenario: str, topic: str, age: int) -> dict:
+    """Issue one request and time it; streaming requests also record first token and first audio"""
+    start = time.perf_counter()
+    sample = {"ttft": None, "ttfa": None, "frames": 0}
+
+    if scenario == "explain":
+        response = await client.post("/explain", json={"topic": topic, "age": age})
+        response.raise_for_status()
+    elif scenario == "explain_stream":
+        async with client.stream("POST", "/explain/stream", json={"topic": topic, "age": age}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                sample["frames"] += 1
+                event = json.loads(line[6:])
+                now = time.perf_counter() - start
+                if event.get("type") == "content" and sample["ttft"] is None:
+                    sample["ttft"] = now
+                elif event.get("type") == "audio" and sample["ttfa"] is None:
+                    sample["ttfa"] = now
+    elif scenario == "quiz_generate":
+        response = await client.post("/quiz/generate", json={"topic": topic, "age": age, "num_questions": 5})
+        response.raise_for_status()
+    else:
+        response = await client.post("/quiz/evaluate", json={
+            "question": f"What is {topic}?",
+            "correct_answer": "A",
+            "user_answer": "B",
+            "age": age
+        })
+        response.raise_for_status()
+
+    sample["latency"] = time.perf_counter() - start
+    return sample
+
+
+async def token_totals(client) -> dict:
+    """Sum the server's prompt and prefill token counters over all stages"""
+    totals = {"prompt": 0.0, "prefill": 0.0}
+    response = await client.get("/metrics")
+    for line in response.text.splitlines():
+        for kind in totals:
+            if line.startswith(f"eli10_{kind}_tokens_total{{"):
+                totals[kind] += float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+async def run_scenario(base_url: str, scenario: str, concurrency: int, requests: int, unique: bool,
+                       cpu_clock=None) -> dict:
+    """Drive one endpoint at a fixed concurrency and summarize the run"""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    run_id = uuid.uuid4().hex[:6]
+    samples = []
+    errors = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        async def one(i: int):
+            topic = BASE_TOPICS[i % len(BASE_TOPICS)]
+            if unique:
+                # Defeat the caches so every request runs the full pipeline
+                topic = f"{topic} {run_id}-{i}"
+            async with semaphore:
+                try:
+                    samples.append(await run_request(client, scenario, topic, 10))
+                except Exception as e:
+                    errors.append(str(e))
+
+        tokens_before = await token_totals(client)
+        cpu_before = cpu_clock() if cpu_clock else None
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+        cpu_after = cpu_clock() if cpu_clock else None
+        tokens_after = await token_totals(client)
+
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "requests_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles([s["latency"] for s in samples]),
+        "prompt_tokens_per_request": round((tokens_after["prompt"] - tokens_before["prompt"]) / requests, 1),
+        "prefill_tokens_per_request": round((tokens_after["prefill"] - tokens_before["prefill"]) / requests, 1)
+    }
+    if scenario == "explain_stream":
+        result["ttft_ms"] = percentiles([s["ttft"] for s in samples if s["ttft"] is not None])
+        result["ttfa_ms"] = percentiles([s["ttfa"] for s in samples if s["ttfa"] is not None])
+        result["frames_per_response"] = round(sum(s["frames"] for s in samples) / len(samples), 1) if samples else 0
+    if cpu_before is not None:
+        # Event loop thread of the in-process server only, so the client's own parsing is excluded
+        result["server_cpu_ms_per_request"] = round((cpu_after - cpu_before) / requests * 1000, 2)
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print p50/p95 latency and throughput changes between two result files"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in old["results"]}
+    print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+    for r in new["results"]:
+        o = previous.get((r["scenario"], r["concurrency"]))
+        if not o or not o["latency_ms"] or not r["latency_ms"]:
+            continue
+        line = f"{r['scenario']:>15} c={r['concurrency']:<3}"
+        for p in ("p50", "p95"):
+            change = (r["latency_ms"][p] - o["latency_ms"][p]) / o["latency_ms"][p] * 100 if o["latency_ms"][p] else 0
+            line += f"  {p} {o['latency_ms'][p]:>8} -> {r['latency_ms'][p]:>8} ms ({change:+.1f}%)"
+        line += f"  rps {o['requests_per_sec']} -> {r['requests_per_sec']}"
+        if "prefill_tokens_per_request" in o:
+            line += f"  prefill/req {o['prefill_tokens_per_request']} -> {r['prefill_tokens_per_request']}"
+        if "frames_per_response" in o and "frames_per_response" in r:
+            line += f"  frames {o['frames_per_response']} -> {r['frames_per_response']}"
+        if "server_cpu_ms_per_request" in o and "server_cpu_ms_per_request" in r:
+            line += f"  cpu/req {o['server_cpu_ms_per_request']} -> {r['server_cpu_ms_per_request']} ms"
+        print(line)
+
+
+async def run_benchmark(args) -> dict:
+    results = []
+    for scenario in args.scenarios.split(","):
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            result = await run_scenario(
+                args.url, scenario, concurrency, args.requests, not args.repeat_topics, args.cpu_clock
+            )
+            print(json.dumps(result))
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the API end to end")
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario and concurrency level")
+    parser.add_argument("--standin-backends", type=int, default=0,
+                        help="Serve the fake LLM from this many local Ollama stand-ins instead of in-process")
+    parser.add_argument("--repeat-topics", action="store_true", help="Reuse topics so caches can hit")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Compare against an earlier results JSON file")
+    args = parser.parse_args()
+
+    args.cpu_clock = None
+    output_path = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    if not args.url:
+        # Reproducible defaults: fake backends and fresh stores in a scratch directory
+        os.environ.setdefault("TTS_BACKEND", "fake")
+        if args.standin_backends:
+            from llm_backends import FakeLLM, create_standin_app
+            urls = []
+            for i in range(args.standin_backends):
+                port = args.port + 1 + i
+                llm = FakeLLM(
+                    float(os.environ.get("FAKE_LLM_LATENCY", "0.2")),
+                    float(os.environ.get("FAKE_LLM_TOKENS_PER_SEC", "50")),
+                    int(os.environ.get("FAKE_LLM_TOKENS", "80")),
+                    float(os.environ.get("FAKE_LLM_PREFILL_TOKENS_PER_SEC", "0"))
+                )
+                start_server(port, create_standin_app(llm))
+                urls.append(f"http://127.0.0.1:{port}")
+            os.environ["LLM_BACKEND"] = "ollama"
+            os.environ["LLM_BACKEND_URLS"] = ",".join(urls)
+        else:
+            os.environ.setdefault("LLM_BACKEND", "fake")
+        os.chdir(tempfile.mkdtemp(prefix="eli10-bench-"))
+        args.cpu_clock = thread_cpu_clock(start_server(args.port))
+        args.url = f"http://127.0.0.1:{args.port}"
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "url": args.url,
+            "llm_backend": os.environ.get("LLM_BACKEND", "ollama"),
+            "llm_backend_urls": os.environ.get("LLM_BACKEND_URLS"),
+            "tts_backend": os.environ.get("TTS_BACKEND", "gtts"),
+            "fake_llm_latency": os.environ.get("FAKE_LLM_LATENCY"),
+            "fake_llm_tokens_per_sec": os.environ.get("FAKE_LLM_TOKENS_PER_SEC"),
+            "fake_llm_prefill_tokens_per_sec": os.environ.get("FAKE_LLM_PREFILL_TOKENS_PER_SEC"),
+            "prompt_reuse": os.environ.get("PROMPT_REUSE") == "1",
+            "sse_flush_interval": os.environ.get("SSE_FLUSH_INTERVAL"),
+            "sse_compact": os.environ.get("SSE_COMPACT") == "1",
+            "requests": args.requests,
+            "repeat_topics": args.repeat_topics
+        },
+        "results": asyncio.run(run_benchmark(args)),
+        "peak_memory_mb": peak_memory_mb()
+    }
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if compare_path:
+        with open(compare_path) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,186 @@
+"""
+Explanation cache for the Explain Like I'm 10 API
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from config import (
+    LLM_BACKEND,
+    LLM_MODEL,
+    LLM_STAGE_MODELS,
+    PROMPT_REUSE,
+    PROMPT_VERSION,
+    AGE_BANDS,
+    EXPLAIN_CACHE_SIZE,
+    EXPLAIN_CACHE_TTL,
+    EXPLAIN_CACHE_DIR
+)
+
+# Stage model overrides and the chat prompts of PROMPT_REUSE change the answers, so they are part of every key
+MODEL_TAG = LLM_MODEL + "".join(f"+{stage}={model}" for stage, model in sorted(LLM_STAGE_MODELS.items()))
+if PROMPT_REUSE:
+    MODEL_TAG += "+chat"
+KEY_PREFIX = f"{LLM_BACKEND}:{MODEL_TAG}|v{PROMPT_VERSION}|"
+
+
+def normalize_topic(topic: str) -> str:
+    """Normalize a topic so trivial spelling variants share a cache entry"""
+    topic = topic.strip().lower()
+    topic = re.sub(r"[^\w\s]", " ", topic)
+    return re.sub(r"\s+", " ", topic).strip()
+
+
+def age_band(age: int) -> str:
+    """Map an age onto its configured age band"""
+    for low, high in AGE_BANDS:
+        if low <= age <= high:
+            return f"{low}-{high}"
+    return str(age)
+
+
+def cache_key(topic: str, age: int) -> str:
+    """Build the cache key for a topic/age pair under the current model and prompts"""
+    return f"{KEY_PREFIX}{age_band(age)}|{normalize_topic(topic)}"
+
+
+def parse_cache_key(key: str) -> Optional[tuple]:
+    """Return (age band, normalized topic) of an explanation key, or None if the key is stale or not one"""
+    if not key.startswith(KEY_PREFIX):
+        return None
+    parts = key[len(KEY_PREFIX):].split("|")
+    return tuple(parts) if len(parts) == 2 else None
+
+
+def quiz_key(topic: str, age: int, num_questions: int, difficulty: str) -> str:
+    """Build the key for a generated quiz under the current model and prompts"""
+    return f"{KEY_PREFIX}{age_band(age)}|{normalize_topic(topic)}|{num_questions}|{difficulty}"
+
+
+class ExplanationCache:
+    """LRU cache with TTL eviction and an optional on-disk backing store"""
+
+    def __init__(self, max_entries: int, ttl: float, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def _load_from_disk(self, key: str) -> Optional[tuple]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if record.get("key") != key or time.time() - record.get("created", 0) > self.ttl:
+            return None
+        return record["created"], record["value"]
+
+    def _save_to_disk(self, key: str, created: float, value: dict) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "created": created, "value": value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None and self.disk_dir:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._insert(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: dict) -> None:
+        """Store value under key, evicting the least recently used entries"""
+        created = time.time()
+        with self._lock:
+            self._insert(key, (created, value))
+        if self.disk_dir:
+            self._save_to_disk(key, created, value)
+
+    def keys(self) -> list:
+        """Keys of every unexpired entry, in memory or on disk"""
+        now = time.time()
+        with self._lock:
+            keys = {key for key, (created, _) in self._entries.items() if now - created <= self.ttl}
+        if self.disk_dir:
+            for entry in os.scandir(self.disk_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        record = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if now - record.get("created", 0) <= self.ttl and "key" in record:
+                    keys.add(record["key"])
+        return list(keys)
+
+    def _insert(self, key: str, entry: tuple) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk_dir": self.disk_dir
+            }
+
+
+def replay_events(entry: dict):
+    """Yield a cached explanation as the same events stream_explain_graph produces"""
+    intent = {"type": "intent", "intent": "new_question", "mode": "full"}
+    if "matched_topic" in entry:
+        intent["matched_topic"] = entry["matched_topic"]
+    yield intent
+    for label, text in entry["sections"].items():
+        if text:
+            yield {"type": "section", "section": label}
+            yield {"type": "content", "section": label, "text": text}
+
+
+# Initialize the cache
+explain_cache = ExplanationCache(EXPLAIN_CACHE_SIZE, EXPLAIN_CACHE_TTL, EXPLAIN_CACHE_DIR)
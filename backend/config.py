@@ -2,20 +2,143 @@
 Configuration settings for the Explain Like I'm 10 API
 """
 import os
-from langchain_ollama import OllamaLLM
 
 # Audio settings
 AUDIO_DIR = "audio"
+AUDIO_MAX_BYTES = 500 * 1024 * 1024  # Evict least recently used audio above this size
+AUDIO_MAX_AGE = 7 * 24 * 60 * 60  # Seconds an unused audio file is kept
+AUDIO_SWEEP_INTERVAL = 10 * 60  # Seconds between background sweeps of AUDIO_DIR
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")  # "gtts" or "fake" (no network, for benchmarks)
+FAKE_TTS_LATENCY = float(os.getenv("FAKE_TTS_LATENCY", "0.3"))  # Seconds per fake synthesis
+# Send /explain/stream audio events when synthesis starts; /audio streams the MP3 while it is written
+AUDIO_PROGRESSIVE = os.getenv("AUDIO_PROGRESSIVE", "") == "1"
 
 # LLM settings
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")  # "ollama" or "fake" (local stand-in for benchmarks)
 LLM_MODEL = "llama3.1:8b"
 LLM_TEMPERATURE = 0
 
-# Initialize LLM
-llm = OllamaLLM(
-    model=LLM_MODEL,
-    temperature=LLM_TEMPERATURE
-)
+# Ollama endpoints the LLM pool balances across (comma-separated in the env var)
+LLM_BACKEND_URLS = os.getenv("LLM_BACKEND_URLS", os.getenv("OLLAMA_HOST", "http://localhost:11434")).split(",")
+
+# Per-stage model overrides; stages not listed use LLM_MODEL. Every backend must have these pulled.
+LLM_STAGE_MODELS = {
+    # "intent": "llama3.2:1b",
+    # "safety": "llama3.2:1b",
+}
+
+# Fake LLM settings (LLM_BACKEND=fake)
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))  # Seconds to first token
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "80"))  # Tokens in a synthetic answer
+FAKE_LLM_PREFILL_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_PREFILL_TOKENS_PER_SEC", "0"))  # 0 = free prefill
+
+# Prompt prefix reuse: run the explanation stages as turns of one chat so each stage's prompt starts
+# with the previous stages' tokens, which the backend still has in its KV cache
+PROMPT_REUSE = os.getenv("PROMPT_REUSE", "") == "1"
+LLM_PREFIX_WINDOW = 8  # Recent prompts per backend assumed cached, for prefill estimates
+
+
+def create_llm(base_url: str = None, model: str = LLM_MODEL, chat: bool = False):
+    """Create a client for one model on one endpoint of the backend selected by LLM_BACKEND"""
+    if LLM_BACKEND == "fake":
+        from llm_backends import FakeLLM
+        return FakeLLM(
+            latency=FAKE_LLM_LATENCY,
+            tokens_per_sec=FAKE_LLM_TOKENS_PER_SEC,
+            num_tokens=FAKE_LLM_TOKENS,
+            prefill_tokens_per_sec=FAKE_LLM_PREFILL_TOKENS_PER_SEC
+        )
+
+    if chat:
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=model,
+            temperature=LLM_TEMPERATURE,
+            base_url=base_url
+        )
+
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(
+        model=model,
+        temperature=LLM_TEMPERATURE,
+        base_url=base_url
+    )
+
+
+# LLM scheduler settings
+LLM_MAX_CONCURRENCY = 2  # Generations in flight per backend
+LLM_MAX_QUEUE = 32  # Requests allowed to wait for a slot per backend before rejecting with 503
+LLM_QUEUE_TIMEOUT = 60  # Seconds a request may wait for a slot
+
+# LLM pool settings
+LLM_REQUEST_TIMEOUT = 120  # Seconds a generation (or a stalled stream) may take before it counts as failed
+LLM_FAILOVER_ATTEMPTS = 2  # Other backends tried after one errors or times out
+LLM_HEALTH_CHECK_INTERVAL = 15  # Seconds between backend health probes
+
+# Degraded mode settings: under load, a local safety filter replaces the LLM safety pass
+DEGRADE_MODE = os.getenv("DEGRADE_MODE", "auto")  # "auto" follows the load; "full" or "degraded" pins the mode
+DEGRADE_QUEUE_RATIO = 0.5  # Share of the pool's queue in use that switches to degraded mode
+DEGRADE_QUEUE_WAIT = float(os.getenv("DEGRADE_QUEUE_WAIT", "5"))  # Average seconds waited for an LLM slot that switches to degraded mode
+DEGRADE_RECOVERY = 0.5  # Load must fall below this fraction of both thresholds to return to full mode
+# Optional stages also skipped in degraded mode (comma-separated in the env var): example, question
+DEGRADE_SKIP_STAGES = [s for s in os.getenv("DEGRADE_SKIP_STAGES", "").split(",") if s]
+
+# Intent classifier settings
+INTENT_CONFIDENCE_THRESHOLD = 0.75  # Below this the local classifier defers to the LLM
+INTENT_LOG_DECISIONS = True  # Print each decision, its source and latency for tuning
+
+# Conversation context settings
+CONTEXT_TOKEN_BUDGET = 1500  # Approximate tokens of history passed to the feedback prompt
+INTENT_CONTEXT_TOKENS = 400  # Approximate tokens of recent history passed to the intent prompt
+CONTEXT_SUMMARY_CACHE_SIZE = 256  # Summaries of older turns kept in memory
+
+# Server-side session settings
+SESSION_STORE_PATH = "sessions.db"  # SQLite history of sessions, shared by all workers
+SESSION_CACHE_SIZE = 1024  # Sessions whose history is kept in memory
+
+# Explanation cache settings
+PROMPT_VERSION = "2"  # Bump when prompts in graph.py change to invalidate cached answers
+AGE_BANDS = [(5, 7), (8, 10), (11, 13), (14, 17), (18, 35)]
+EXPLAIN_CACHE_SIZE = 512  # Max entries kept in memory
+EXPLAIN_CACHE_TTL = 24 * 60 * 60  # Seconds before a cached answer expires
+EXPLAIN_CACHE_DIR = os.getenv("EXPLAIN_CACHE_DIR")  # Optional on-disk backing store
+
+# Near-duplicate topic matching: rephrased or misspelled topics reuse an answer already generated
+TOPIC_MATCH = os.getenv("TOPIC_MATCH", "1") == "1"
+TOPIC_MATCH_THRESHOLD = float(os.getenv("TOPIC_MATCH_THRESHOLD", "0.6"))  # Cosine similarity of whole topics
+TOPIC_WORD_THRESHOLD = 0.8  # Similarity every word needs to a word of the other topic (typo tolerance)
+TOPIC_TYPO_THRESHOLD = 0.6  # The same for a word one typing slip away from the other ("gravitiy")
+TOPIC_KNOWN_WORD_THRESHOLD = 0.9  # The same for a word already known as a real word (TOPIC_PACKS, indexed topics)
+TOPIC_INDEX_MAX = 2048  # Topics indexed per age band; the oldest are dropped first
+
+# Bulk explain settings
+BULK_EXPLAIN_CONCURRENCY = 4  # Items of one /explain/bulk request generated in parallel by default
+BULK_EXPLAIN_MAX_CONCURRENCY = 8  # Upper bound on the concurrency a request may ask for
+BULK_EXPLAIN_MAX_ITEMS = 50  # Items accepted in one request
+
+# Quiz settings
+QUIZ_REGENERATE_ATTEMPTS = 2  # Tries to replace one malformed quiz question
+QUIZ_BATCH_MAX_ANSWERS = 50  # Answers accepted in one /quiz/evaluate/batch request
+QUESTION_BANK_PATH = "questions.db"  # SQLite bank of generated quiz questions
+
+# Topic pack pre-generation settings
+PACK_STORE_PATH = "packs.db"  # SQLite store of pre-generated topic pack answers
+PACK_AUDIO_DIR = "pack_audio"  # Pre-generated audio, never touched by the sweeper
+WARMUP_CONCURRENCY = 2  # Pack items generated in parallel
+WARMUP_QUIZ_DIFFICULTIES = ["medium"]
+WARMUP_QUIZ_QUESTIONS = 5
+
+# SSE framing settings
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.04"))  # Seconds tokens are batched per frame, 0 = one frame per chunk
+SSE_FLUSH_BYTES = 512  # Buffered text that is flushed without waiting for the interval
+SSE_COMPACT = os.getenv("SSE_COMPACT", "") == "1"  # Minimal JSON separators and raw UTF-8 in frames
+STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", "30"))  # Seconds a stream keeps generating with no client connected, waiting for a resume
+STREAM_RESUME_TTL = 5 * 60  # Seconds a finished stream's events are kept for Last-Event-ID resumes
+STREAM_RESUME_MAX = 256  # Streams whose events are buffered at once
+
+# Observability settings
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "") == "1"  # Print a JSON trace line per stage
 
 # CORS settings
 CORS_ORIGINS = ["*"]
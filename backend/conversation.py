@@ -0,0 +1,141 @@
+"""
+Rolling context compaction for long conversations
+"""
+import re
+import asyncio
+import hashlib
+from collections import OrderedDict
+import llm_client
+from metrics import estimate_tokens
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_CACHE_SIZE
+
+SUMMARY_PROMPT = """
+Summarize this conversation between a student and a teacher in at most 5 short sentences.
+Keep the topics discussed, questions the teacher asked and how the student answered.
+
+{previous}
+Conversation:
+{turns}
+
+Respond with ONLY the summary.
+"""
+
+# Summaries keyed by a hash of the turns they cover
+_summaries = OrderedDict()
+_pending = set()
+_background_tasks = set()
+
+
+def split_turns(context: str) -> list:
+    """Split conversation history into turns, each a user message and the reply that followed"""
+    turns = re.split(r"(?m)^(?=User: )", context)
+    return [turn.strip() for turn in turns if turn.strip()]
+
+
+def _prefix_keys(turns: list) -> list:
+    """Return a hash for every prefix of turns, so summaries can be extended incrementally"""
+    digest = hashlib.sha256()
+    keys = []
+    for turn in turns:
+        digest.update(turn.encode("utf-8"))
+        digest.update(b"\0")
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def _get_summary(key: str):
+    summary = _summaries.get(key)
+    if summary is not None:
+        _summaries.move_to_end(key)
+    return summary
+
+
+def _store_summary(key: str, summary: str) -> None:
+    _summaries[key] = summary
+    _summaries.move_to_end(key)
+    while len(_summaries) > CONTEXT_SUMMARY_CACHE_SIZE:
+        _summaries.popitem(last=False)
+
+
+async def _summarize(older: list, keys: list, start: int, previous: str) -> None:
+    """Fold older[start:] into the summary of older[:start] and cache it"""
+    target = keys[-1]
+    try:
+        prompt = SUMMARY_PROMPT.format(
+            previous=f"Summary so far:\n{previous}\n" if previous else "",
+            turns="\n\n".join(older[start:])
+        )
+        summary = (await llm_client.ainvoke(prompt, stage="summarize")).strip()
+        _store_summary(target, summary)
+    except Exception as e:
+        print(f"Error summarizing conversation: {e}")
+    finally:
+        _pending.discard(target)
+
+
+def recent_slice(context: str, budget: int) -> str:
+    """Return the most recent whole turns that fit within budget tokens (always at least one)"""
+    turns = split_turns(context)
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn)
+        if kept and used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+    return "\n\n".join(reversed(kept))
+
+
+def compact_context(context: str, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Fit conversation history into a token budget
+
+    Recent turns are kept verbatim. Older turns are replaced by a cached summary.
+    The summary is extended in the background, so a request never waits on summarization.
+    Turns the summary does not cover yet stay verbatim, within budget, until it catches up.
+
+    Args:
+        context: Full conversation history
+        budget: Approximate token budget for the returned context
+
+    Returns:
+        str: Compacted conversation history
+    """
+    if estimate_tokens(context) <= budget:
+        return context
+
+    turns = split_turns(context)
+    recent = recent_slice(context, budget // 2)
+    older = turns[:len(turns) - len(split_turns(recent))]
+    if not older:
+        return recent
+
+    keys = _prefix_keys(older)
+
+    # Find the longest prefix of the older turns that already has a summary
+    covered = 0
+    summary = ""
+    for i in range(len(keys), 0, -1):
+        cached = _get_summary(keys[i - 1])
+        if cached is not None:
+            covered, summary = i, cached
+            break
+
+    if covered < len(older) and keys[-1] not in _pending:
+        _pending.add(keys[-1])
+        task = asyncio.ensure_future(_summarize(older, keys, covered, summary))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    # Until the summary catches up, keep only as many uncovered turns as the budget allows
+    uncovered = older[covered:]
+    while len(uncovered) > 1 and estimate_tokens("\n\n".join(uncovered)) > budget // 2:
+        uncovered.pop(0)
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of earlier conversation: {summary}")
+    parts.extend(uncovered)
+    parts.append(recent)
+    return "\n\n".join(parts)
@@ -1,25 +1,27 @@
 """
 LangGraph workflow for generating age-appropriate explanations
 """
+import re
+import time
+from typing import Optional
 from langgraph.graph import StateGraph, END
+from langgraph.types import StreamWriter
 from models import ExplainState
-from config import llm
+from intent import classify_intent
+from conversation import compact_context, recent_slice
+from safety_filter import check_text
+from load_policy import load_policy
+from config import (
+    INTENT_CONFIDENCE_THRESHOLD, INTENT_LOG_DECISIONS, INTENT_CONTEXT_TOKENS, PROMPT_REUSE, DEGRADE_SKIP_STAGES
+)
+import metrics
+import llm_client
 
 
 # -----------------------------
 # GRAPH NODES
 # -----------------------------
-def infer_intent(state: ExplainState):
-    """Infer the user's intent from their input and context"""
-    topic = state['topic']
-    context = state.get('context', '')
-    
-    # If no context, it's definitely a new question
-    if not context:
-        return {"intent": "new_question"}
-    
-    # Use LLM to infer intent
-    intent_prompt = f"""
+INTENT_PROMPT = """
 Analyze the user's input and conversation history to determine their intent.
 
 Conversation history:
@@ -34,27 +36,31 @@ Determine if this is:
 
 Respond with ONLY one word: new_question, answer, or followup
 """
-    
-    response = llm.invoke(intent_prompt).strip().lower()
-    
-    # Parse and validate intent
-    if "answer" in response:
-        intent = "answer"
-    elif "followup" in response or "follow" in response:
-        intent = "followup"
-    else:
-        intent = "new_question"
-    
-    return {"intent": intent}
 
+SAFETY_PROMPT = """
+Check that this is SAFE and AGE-APPROPRIATE for age {age}.
 
-def simplify(state: ExplainState):
-    """Simplify the topic for the given age level"""
-    prompt = f"""
-Explain "{state['topic']}" for someone who is {state['age']} years old.
+Text:
+{text}
+Example:
+{example}
 
 Rules:
-- Vocabulary appropriate for age {state['age']}
+- No violence
+- No adult content
+- No fear-based language
+- Positive and encouraging tone
+- Simple language
+
+If the text already follows every rule, respond with exactly SAFE and nothing else.
+Otherwise respond with only the rewritten text. Do not list the rules or add metadata such as "Here's a rewritten version".
+"""
+
+SIMPLIFY_PROMPT = """
+Explain "{topic}" for someone who is {age} years old.
+
+Rules:
+- Vocabulary appropriate for age {age}
 - Short sentences if age < 12
 - Moderate detail if age 12–18
 - Clear but concise if age > 18
@@ -63,80 +69,250 @@ Rules:
 No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
 Remove Here's a rewritten version or Here's an example or similar metadata if present.
 """
-    return {"simplified": llm.invoke(prompt).strip()}
-
 
-def example(state: ExplainState):
-    """Generate a real-life example"""
-    prompt = f"""
-Give ONE real-life example suitable for age {state['age']}.
+EXAMPLE_PROMPT = """
+Give ONE real-life example suitable for age {age}.
 
 Concept:
-{state['simplified']}
-
-No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
-Remove Here's a rewritten version or Here's an example or similar metadata if present.
-"""
-    return {"example": llm.invoke(prompt).strip()}
-
-
-def safety(state: ExplainState):
-    """Ensure content is safe and age-appropriate"""
-    prompt = f"""
-Ensure this is SAFE and AGE-APPROPRIATE for age {state['age']}.
-
-Text:
-{state['simplified']}
-Example:
-{state['example']}
-
-Rules:
-- No violence
-- No adult content
-- No fear-based language
-- Positive and encouraging tone
-- Simple language
+{simplified}
 
 No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
 Remove Here's a rewritten version or Here's an example or similar metadata if present.
 """
-    return {"safe_text": llm.invoke(prompt).strip()}
 
-
-def question(state: ExplainState):
-    """Generate a thinking question"""
-    prompt = f"""
-Create ONE thinking question suitable for age {state['age']}.
+QUESTION_PROMPT = """
+Create ONE thinking question suitable for age {age}.
 
 Based on:
-{state['safe_text']}
+{simplified}
 No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
 Remove Here's a thinking question or similar metadata if present.
 """
-    return {"question": llm.invoke(prompt).strip()}
 
-
-def evaluate_answer(state: ExplainState):
-    """Evaluate user's answer to a previous question"""
-    prompt = f"""
+FEEDBACK_PROMPT = """
 You are a helpful teacher evaluating a student's answer.
 
-Student's age: {state['age']}
+Student's age: {age}
 Previous conversation:
-{state.get('context', '')}
+{context}
 
-Student's latest response: {state['topic']}
+Student's latest response: {topic}
 
 Provide encouraging feedback:
 - Acknowledge what they got right
 - Gently correct any misconceptions
 - Build on their understanding
-- Keep it age-appropriate for {state['age']} years old
+- Keep it age-appropriate for {age} years old
 - Be positive and encouraging
 
 Keep your response conversational and friendly.
 """
-    return {"feedback": llm.invoke(prompt).strip()}
+
+
+# PROMPT_REUSE mode: the stages are turns of one chat, so every stage's prompt starts with the
+# system prompt and the earlier turns, and the backend only prefills the newest message
+CHAT_SYSTEM_PROMPT = """
+You are a friendly teacher talking with someone who is {age} years old.
+
+Rules:
+- Vocabulary appropriate for age {age}
+- Short sentences if age < 12
+- Moderate detail if age 12–18
+- Clear but concise if age > 18
+- No jargon unless age > 20
+
+The rules are for your internal use only; never list them. Reply with only the text the learner should see, with no metadata such as "Here's a rewritten version" or "Here's an example".
+"""
+
+CHAT_PROMPTS = {
+    "simplify": 'Explain "{topic}".',
+    "example": "Give ONE real-life example of this concept.",
+    "safety": (
+        "Check that your explanation and example are SAFE and AGE-APPROPRIATE: no violence, no adult content, "
+        "no fear-based language, a positive and encouraging tone, and simple language.\n"
+        "If they already follow every rule, respond with exactly SAFE and nothing else. "
+        "Otherwise respond with only the rewritten explanation."
+    ),
+    "question": "Create ONE thinking question about your explanation. Reply with only the question."
+}
+
+
+def chat_messages(stage: str, topic: str, age: int, simplified: str = "", example: str = "") -> list:
+    """Build the chat history for one explanation stage in PROMPT_REUSE mode"""
+    messages = [
+        ("system", CHAT_SYSTEM_PROMPT.format(age=age)),
+        ("human", CHAT_PROMPTS["simplify"].format(topic=topic))
+    ]
+    if stage == "simplify":
+        return messages
+    messages.append(("ai", simplified))
+    if stage in ("example", "question"):
+        # Both branch off the explanation, so they can run at the same time
+        return messages + [("human", CHAT_PROMPTS[stage])]
+    return messages + [("human", CHAT_PROMPTS["example"]), ("ai", example), ("human", CHAT_PROMPTS[stage])]
+
+
+async def run_stage(stage: str, prompt: str, topic: str, age: int, simplified: str = "", example: str = "") -> str:
+    """Run one explanation stage as its standalone prompt, or as a chat turn in PROMPT_REUSE mode"""
+    if PROMPT_REUSE:
+        messages = chat_messages(stage, topic, age, simplified, example)
+        return await llm_client.achat(messages, stage=stage, affinity=f"{topic}|{age}")
+    return await llm_client.ainvoke(prompt, stage=stage)
+
+
+def stream_stage(stage: str, prompt: str, topic: str, age: int, simplified: str = "", example: str = ""):
+    """Streaming counterpart of run_stage"""
+    if PROMPT_REUSE:
+        messages = chat_messages(stage, topic, age, simplified, example)
+        return llm_client.astream_chat(messages, stage=stage, affinity=f"{topic}|{age}")
+    return llm_client.astream(prompt, stage=stage)
+
+
+async def stream_section(writer: StreamWriter, section: str, chunks) -> str:
+    """Send a stage's chunks as events of one section and return the full text"""
+    writer({"type": "section", "section": section})
+    text = ""
+    async for chunk in chunks:
+        chunk = str(chunk)
+        text += chunk
+        writer({"type": "content", "section": section, "text": chunk})
+    return text.strip()
+
+
+def safety_revision(response: str, original: str) -> Optional[str]:
+    """Return the safety pass's rewrite of the explanation, or None if it left the text as is"""
+    response = response.strip()
+    if not response or response.rstrip(".").upper() == "SAFE":
+        return None
+    match = re.search(r"(Let's talk about.*)", response, re.DOTALL)
+    content = match.group(1) if match else response
+    content = re.sub(r"\n\s*\n", "\n\n", content).strip()
+    return None if content == original.strip() else content
+
+
+async def resolve_intent(topic: str, context: str, allow_llm: bool = True) -> str:
+    """Classify intent locally and only ask the LLM when the local classifier is unsure (and allowed)"""
+    # If no context, it's definitely a new question
+    if not context:
+        return "new_question"
+
+    start = time.perf_counter()
+    intent, confidence, features = classify_intent(topic, context)
+    source = "local"
+
+    if confidence < INTENT_CONFIDENCE_THRESHOLD and allow_llm:
+        # Use LLM to infer intent, only the latest turns matter for this
+        intent_context = recent_slice(context, INTENT_CONTEXT_TOKENS)
+        response = (await llm_client.ainvoke(INTENT_PROMPT.format(context=intent_context, topic=topic), stage="intent")).strip().lower()
+        source = "llm"
+
+        # Parse and validate intent
+        if "answer" in response:
+            intent = "answer"
+        elif "followup" in response or "follow" in response:
+            intent = "followup"
+        else:
+            intent = "new_question"
+
+    if INTENT_LOG_DECISIONS:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Intent {intent} via {source} (confidence {confidence:.2f}, {elapsed_ms:.1f} ms) features={features}")
+
+    return intent
+
+
+def skipped(state: ExplainState, stage: str) -> bool:
+    """Whether an optional stage is left out of this request"""
+    return state.get('mode') == "degraded" and stage in DEGRADE_SKIP_STAGES
+
+
+async def infer_intent(state: ExplainState, writer: StreamWriter):
+    """Pick the pipeline mode from the current load, then infer the user's intent"""
+    mode = state.get('mode') or load_policy.mode()
+    # Degraded mode trusts the local classifier rather than queue for the LLM
+    intent = await resolve_intent(state['topic'], state.get('context', ''), allow_llm=mode != "degraded")
+    writer({"type": "intent", "intent": intent, "mode": mode})
+    return {"intent": intent, "mode": mode}
+
+
+async def simplify(state: ExplainState, writer: StreamWriter):
+    """Simplify the topic for the given age level"""
+    prompt = SIMPLIFY_PROMPT.format(topic=state['topic'], age=state['age'])
+    chunks = stream_stage("simplify", prompt, state['topic'], state['age'])
+    return {"simplified": await stream_section(writer, "Explanation", chunks)}
+
+
+async def example(state: ExplainState, writer: StreamWriter):
+    """Generate a real-life example"""
+    if skipped(state, "example"):
+        return {"example": ""}
+    prompt = EXAMPLE_PROMPT.format(age=state['age'], simplified=state['simplified'])
+    chunks = stream_stage("example", prompt, state['topic'], state['age'], state['simplified'])
+    return {"example": await stream_section(writer, "Example", chunks)}
+
+
+async def safety(state: ExplainState, writer: StreamWriter):
+    """Ensure content is safe and age-appropriate"""
+    if state.get('mode') == "degraded":
+        return await local_safety(state, writer)
+
+    prompt = SAFETY_PROMPT.format(age=state['age'], text=state['simplified'], example=state['example'])
+    response = await run_stage("safety", prompt, state['topic'], state['age'], state['simplified'], state['example'])
+    revision = safety_revision(response, state['simplified'])
+    # Only send a correction when the safety pass actually changed the explanation
+    if revision:
+        writer({"type": "update", "section": "Explanation", "text": revision})
+    return {"safe_text": revision or state['simplified']}
+
+
+async def local_safety(state: ExplainState, writer: StreamWriter):
+    """Degraded-mode safety pass: word lists, pattern rules and a readability check instead of the LLM"""
+    revised = {}
+    # The question is ready by now too, and checking it locally costs nothing
+    for key, section in (("simplified", "Explanation"), ("example", "Example"), ("question", "Question")):
+        if not state[key]:
+            continue
+        report = check_text(state[key], state['age'])
+        if report["flagged"] and not report["text"]:
+            # Every sentence was flagged; rewriting it is worth one LLM call, blanking the section is not
+            prompt = SAFETY_PROMPT.format(age=state['age'], text=state[key], example="")
+            rewrite = safety_revision(await llm_client.ainvoke(prompt, stage="safety"), state[key])
+            metrics.local_safety.inc("escalated")
+            print(f"Local safety filter flagged all of {section}, sent it to the LLM safety pass")
+            if rewrite:
+                revised[key] = rewrite
+                writer({"type": "update", "section": section, "text": rewrite})
+        elif report["flagged"]:
+            # Only removed content is worth re-sending the section and re-synthesizing its audio
+            revised[key] = report["text"]
+            writer({"type": "update", "section": section, "text": report["text"]})
+            metrics.local_safety.inc("revised")
+            print(f"Local safety filter removed {', '.join(report['flagged'])} content from {section}")
+        elif report["too_hard"]:
+            # Counted so the readability gap of degraded answers stays visible
+            metrics.local_safety.inc("too_hard")
+        else:
+            metrics.local_safety.inc("passed")
+    revised["safe_text"] = revised.pop("simplified", state['simplified'])
+    return revised
+
+
+async def question(state: ExplainState, writer: StreamWriter):
+    """Generate a thinking question"""
+    if skipped(state, "question"):
+        return {"question": ""}
+    prompt = QUESTION_PROMPT.format(age=state['age'], simplified=state['simplified'])
+    chunks = stream_stage("question", prompt, state['topic'], state['age'], state['simplified'])
+    return {"question": await stream_section(writer, "Question", chunks)}
+
+
+async def evaluate_answer(state: ExplainState, writer: StreamWriter):
+    """Evaluate user's answer to a previous question"""
+    prompt = FEEDBACK_PROMPT.format(
+        age=state['age'], context=compact_context(state.get('context', '')), topic=state['topic']
+    )
+    chunks = llm_client.astream(prompt, stage="feedback")
+    return {"feedback": await stream_section(writer, "Feedback", chunks)}
 
 
 def format_out(state: ExplainState):
@@ -148,6 +324,7 @@ def format_out(state: ExplainState):
         return {
             "output": {
                 "intent": "answer",
+                "mode": state.get("mode", "full"),
                 "feedback": state.get("feedback", "")
             }
         }
@@ -156,6 +333,7 @@ def format_out(state: ExplainState):
         return {
             "output": {
                 "intent": intent,
+                "mode": state.get("mode", "full"),
                 "topic": state["topic"],
                 "age": state["age"],
                 "explanation": state.get("safe_text", ""),
@@ -185,9 +363,10 @@ def build_explain_graph():
     # Add nodes
     graph.add_node("infer_intent", infer_intent)
     graph.add_node("simplify", simplify)
-    graph.add_node("example", example)
+    # Node names must not collide with ExplainState keys
+    graph.add_node("add_example", example)
     graph.add_node("safety", safety)
-    graph.add_node("question", question)
+    graph.add_node("think_question", question)
     graph.add_node("evaluate", evaluate_answer)
     graph.add_node("format", format_out)
     
@@ -204,11 +383,12 @@ def build_explain_graph():
         }
     )
     
-    # Explanation path
-    graph.add_edge("simplify", "example")
-    graph.add_edge("example", "safety")
-    graph.add_edge("safety", "question")
-    graph.add_edge("question", "format")
+    # Explanation path: the example and the question both build on the explanation, so they run
+    # in parallel; the safety review needs the example and starts once both branches are done
+    graph.add_edge("simplify", "add_example")
+    graph.add_edge("simplify", "think_question")
+    graph.add_edge("add_example", "safety")
+    graph.add_edge(["safety", "think_question"], "format")
     
     # Answer evaluation path
     graph.add_edge("evaluate", "format")
@@ -226,160 +406,50 @@ explain_graph = build_explain_graph()
 # -----------------------------
 # STREAMING FUNCTION
 # -----------------------------
-async def stream_explain_graph(topic: str, age: int, context: str = ""):
-    """Stream the explanation generation process in real-time with intent inference"""
-    import re
-    
-    # Step 1: Infer intent
-    if not context:
-        intent = "new_question"
-    else:
-        intent_prompt = f"""
-Analyze the user's input and conversation history to determine their intent.
-
-Conversation history:
-{context}
-
-User's latest input: {topic}
+# Graph node that produces each streamed section
+NODE_SECTIONS = {
+    "simplify": "Explanation",
+    "add_example": "Example",
+    "think_question": "Question",
+    "evaluate": "Feedback"
+}
 
-Determine if this is:
-1. "new_question" - User is asking about a new topic
-2. "answer" - User is answering a previous question
-3. "followup" - User is asking a follow-up question about the current topic
 
-Respond with ONLY one word: new_question, answer, or followup
-"""
-        
-        response = llm.invoke(intent_prompt).strip().lower()
-        
-        # Parse and validate intent
-        if "answer" in response:
-            intent = "answer"
-        elif "followup" in response or "follow" in response:
-            intent = "followup"
+async def stream_explain_graph(topic: str, age: int, context: str = ""):
+    """
+    Stream explain_graph's events in real-time with intent inference
+
+    Nodes send their tokens as custom stream events. Sections of parallel branches are sent one
+    after another in reading order: a section's events are held until the sections before it
+    have finished, and a safety update comes last.
+    """
+    pending = []  # Sections not finished yet, in the order they are sent
+    finished = set()
+    held = {}  # Section -> events waiting for the sections before it
+    updates = []
+
+    stream = explain_graph.astream(
+        {"topic": topic, "age": age, "context": context}, stream_mode=["custom", "updates"]
+    )
+    async for mode, chunk in stream:
+        if mode == "updates":
+            finished.update(NODE_SECTIONS[node] for node in chunk if node in NODE_SECTIONS)
+            # Release the next section once everything before it is out
+            while pending and pending[0] in finished:
+                pending.pop(0)
+                for event in held.pop(pending[0], []) if pending else []:
+                    yield event
+            continue
+
+        if chunk["type"] == "intent":
+            pending = ["Feedback"] if chunk["intent"] == "answer" else ["Explanation", "Example", "Question"]
+            yield chunk
+        elif chunk["type"] == "update":
+            updates.append(chunk)
+        elif pending and chunk.get("section") != pending[0]:
+            held.setdefault(chunk.get("section"), []).append(chunk)
         else:
-            intent = "new_question"
-    
-    # Send intent to client
-    yield {"type": "intent", "intent": intent}
-    
-    if intent == "answer":
-        # Provide feedback on the answer
-        yield {"type": "section", "section": "Feedback"}
-        
-        feedback_prompt = f"""
-You are a helpful teacher evaluating a student's answer.
-
-Student's age: {age}
-Previous conversation:
-{context}
-
-Student's latest response: {topic}
-
-Provide encouraging feedback:
-- Acknowledge what they got right
-- Gently correct any misconceptions
-- Build on their understanding
-- Keep it age-appropriate for {age} years old
-- Be positive and encouraging
-
-Keep your response conversational and friendly.
-"""
-        
-        async for chunk in llm.astream(feedback_prompt):
-            text = str(chunk)
-            yield {"type": "content", "section": "Feedback", "text": text}
-        return  # Exit early for answer feedback
-    
-    # Provide topic explanation
-    # Step 2: Simplify
-    yield {"type": "section", "section": "Explanation"}
-    
-    simplify_prompt = f"""
-Explain "{topic}" for someone who is {age} years old.
-
-Rules:
-- Vocabulary appropriate for age {age}
-- Short sentences if age < 12
-- Moderate detail if age 12–18
-- Clear but concise if age > 18
-- No jargon unless age > 20
-
-No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
-Remove Here's a rewritten version or Here's an example or similar metadata if present.
-"""
-    
-    simplified_text = ""
-    async for chunk in llm.astream(simplify_prompt):
-        text = str(chunk)
-        simplified_text += text
-        yield {"type": "content", "section": "Explanation", "text": text}
-    
-    # Step 2: Example
-    yield {"type": "section", "section": "Example"}
-    
-    example_prompt = f"""
-Give ONE real-life example suitable for age {age}.
-
-Concept:
-{simplified_text}
-
-No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
-Remove Here's a rewritten version or Here's an example or similar metadata if present.
-"""
-    
-    example_text = ""
-    async for chunk in llm.astream(example_prompt):
-        text = str(chunk)
-        example_text += text
-        yield {"type": "content", "section": "Example", "text": text}
-    
-    # Step 3: Safety check and refinement
-    safety_prompt = f"""
-Ensure this is SAFE and AGE-APPROPRIATE for age {age}.
+            yield chunk
 
-Text:
-{simplified_text}
-Example:
-{example_text}
-
-Rules:
-- No violence
-- No adult content
-- No fear-based language
-- Positive and encouraging tone
-- Simple language
-
-No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
-Remove Here's a rewritten version or Here's an example or similar metadata if present.
-"""
-    
-    safe_text = ""
-    async for chunk in llm.astream(safety_prompt):
-        safe_text += str(chunk)
-    
-    # Update Explanation with safe text if different
-    if safe_text and safe_text != simplified_text:
-        # Extract useful content from safety check
-        match = re.search(r"(Let's talk about.*)", safe_text, re.DOTALL)
-        content = match.group(1) if match else safe_text
-        content = re.sub(r"\n\s*\n", "\n\n", content).strip()
-        
-        if content != simplified_text:
-            yield {"type": "update", "section": "Explanation", "text": content}
-    
-    # Step 4: Question
-    yield {"type": "section", "section": "Question"}
-    
-    question_prompt = f"""
-Create ONE thinking question suitable for age {age}.
-
-Based on:
-{safe_text if safe_text else simplified_text}
-No need to mention safety rules in output as bullet points at all. rules are for your internal use only. End user should only see the final safe text, no metadata needed as well.
-Remove Here's a thinking question or similar metadata if present.
-"""
-    
-    async for chunk in llm.astream(question_prompt):
-        text = str(chunk)
-        yield {"type": "content", "section": "Question", "text": text}
+    for event in updates:
+        yield event
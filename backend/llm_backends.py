@@ -0,0 +1,187 @@
+"""
+Local stand-in LLM backends for benchmarks and offline development
+
+FakeLLM replaces the Ollama client in-process. The same fake can also be served over the
+Ollama HTTP API, so the backend pool can be exercised against several local servers:
+
+    python llm_backends.py --port 11501 &
+    python llm_backends.py --port 11502 --error-rate 0.2 &
+    LLM_BACKEND_URLS=http://127.0.0.1:11501,http://127.0.0.1:11502 python main.py
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import os.path
+from collections import deque
+
+WORDS = (
+    "the sun gives plants light so they can make food from water and air which helps "
+    "them grow tall and strong just like you need breakfast to play all day long"
+).split()
+
+
+class FakeLLM:
+    """
+    Deterministic LLM stand-in with the same invoke/ainvoke/astream surface as OllamaLLM
+
+    Prompts may also be chat messages as (role, content) pairs, like ChatOllama takes.
+    Output is canned for prompts whose format the app parses (intent, quizzes, feedback JSON)
+    and synthetic text otherwise. It is seeded by the prompt so runs are reproducible.
+    Latency is a fixed time to first token followed by a steady tokens-per-second rate.
+    With prefill_tokens_per_sec set, the time to first token also grows with the part of the
+    prompt not shared with a recent prompt, like a backend reusing its KV cache.
+    """
+
+    def __init__(
+        self, latency: float = 0.2, tokens_per_sec: float = 50.0, num_tokens: int = 80,
+        prefill_tokens_per_sec: float = 0.0
+    ):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.num_tokens = num_tokens
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self._recent = deque(maxlen=8)
+
+    def _render(self, prompt) -> str:
+        if isinstance(prompt, str):
+            return prompt
+        return "\n".join(f"{role}: {content}" for role, content in prompt)
+
+    def _first_token_delay(self, prompt: str) -> float:
+        if not self.prefill_tokens_per_sec:
+            return self.latency
+        shared = max((len(os.path.commonprefix([prompt, p])) for p in self._recent), default=0)
+        self._recent.append(prompt)
+        return self.latency + (len(prompt) - shared) / 4 / self.prefill_tokens_per_sec
+
+    def _respond(self, prompt: str) -> str:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+        if "Respond with ONLY one word: new_question, answer, or followup" in prompt:
+            return "new_question"
+
+        quiz = re.search(r"Generate (\d+|ONE) multiple-choice quiz question", prompt)
+        if quiz:
+            count = 1 if quiz.group(1) == "ONE" else int(quiz.group(1))
+            questions = [self._question(rng, i) for i in range(count)]
+            return json.dumps(questions[0] if count == 1 else questions, indent=2)
+
+        if "respond with exactly SAFE" in prompt:
+            return "SAFE"
+
+        if '"feedback": "Feedback message here"' in prompt:
+            return json.dumps({"feedback": "Nice work, keep it up!", "explanation": ""})
+
+        return " ".join(rng.choice(WORDS) for _ in range(self.num_tokens)).capitalize() + "."
+
+    def _question(self, rng: random.Random, index: int) -> dict:
+        return {
+            "question": f"Question {index + 1}: what does {rng.choice(WORDS)} need?",
+            "options": {letter: rng.choice(WORDS) for letter in "ABCD"},
+            "correct": rng.choice("ABCD"),
+            "explanation": "Because " + " ".join(rng.choice(WORDS) for _ in range(8)) + "."
+        }
+
+    def _tokens(self, text: str) -> list:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def invoke(self, prompt) -> str:
+        prompt = self._render(prompt)
+        text = self._respond(prompt)
+        time.sleep(self._first_token_delay(prompt) + len(self._tokens(text)) / self.tokens_per_sec)
+        return text
+
+    async def ainvoke(self, prompt) -> str:
+        prompt = self._render(prompt)
+        text = self._respond(prompt)
+        await asyncio.sleep(self._first_token_delay(prompt) + len(self._tokens(text)) / self.tokens_per_sec)
+        return text
+
+    async def astream(self, prompt):
+        prompt = self._render(prompt)
+        await asyncio.sleep(self._first_token_delay(prompt))
+        for token in self._tokens(self._respond(prompt)):
+            await asyncio.sleep(1 / self.tokens_per_sec)
+            yield token
+
+
+def create_standin_app(llm: FakeLLM, error_rate: float = 0.0):
+    """FastAPI app answering the subset of the Ollama API that OllamaLLM and the health check use"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI(title="Stand-in Ollama")
+    models = set()
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": [{"name": name, "model": name} for name in sorted(models)]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        models.add(model)
+        if error_rate and random.random() < error_rate:
+            return JSONResponse(status_code=500, content={"error": "stand-in failure"})
+
+        def frame(text: str, done: bool) -> str:
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            return json.dumps({"model": model, "created_at": created, "response": text, "done": done}) + "\n"
+
+        if body.get("stream", True) is False:
+            return JSONResponse(json.loads(frame(await llm.ainvoke(body.get("prompt", "")), True)))
+
+        async def stream():
+            async for token in llm.astream(body.get("prompt", "")):
+                yield frame(token, False)
+            yield frame("", True)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        models.add(model)
+        if error_rate and random.random() < error_rate:
+            return JSONResponse(status_code=500, content={"error": "stand-in failure"})
+        messages = [(m["role"], m.get("content", "")) for m in body.get("messages", [])]
+
+        def frame(text: str, done: bool) -> str:
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            message = {"role": "assistant", "content": text}
+            return json.dumps({"model": model, "created_at": created, "message": message, "done": done}) + "\n"
+
+        if body.get("stream", True) is False:
+            return JSONResponse(json.loads(frame(await llm.ainvoke(messages), True)))
+
+        async def stream():
+            async for token in llm.astream(messages):
+                yield frame(token, False)
+            yield frame("", True)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the fake LLM over the Ollama HTTP API")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=80, help="Tokens in a synthetic answer")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=0.0, help="0 = free prompt prefill")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    args = parser.parse_args()
+
+    llm = FakeLLM(args.latency, args.tokens_per_sec, args.tokens, args.prefill_tokens_per_sec)
+    app = create_standin_app(llm, args.error_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
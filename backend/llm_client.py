@@ -0,0 +1,348 @@
+"""
+Async LLM client that balances generations across a pool of backends
+"""
+import time
+import asyncio
+import hashlib
+import os.path
+from collections import deque
+from contextlib import asynccontextmanager
+import httpx
+import metrics
+from config import (
+    create_llm,
+    LLM_BACKEND,
+    LLM_MODEL,
+    LLM_BACKEND_URLS,
+    LLM_STAGE_MODELS,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE,
+    LLM_QUEUE_TIMEOUT,
+    LLM_REQUEST_TIMEOUT,
+    LLM_FAILOVER_ATTEMPTS,
+    LLM_HEALTH_CHECK_INTERVAL,
+    LLM_PREFIX_WINDOW
+)
+
+WAIT_AVERAGE_WEIGHT = 0.2  # Weight of the newest wait in LLMScheduler.recent_wait
+
+
+class OverloadedError(Exception):
+    """Raised when the scheduler queue is full or a request waited too long for a slot"""
+
+
+class LLMScheduler:
+    """Caps in-flight generations for one backend and queues the rest up to a fixed depth"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.recent_wait = 0.0  # Moving average of seconds spent waiting for a slot
+        self._semaphore = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def has_capacity(self) -> bool:
+        """Whether a new request could at least be queued"""
+        return self.active < self.max_concurrency or self.waiting < self.max_queue
+
+    def check_capacity(self) -> None:
+        """Raise OverloadedError if a new request could not even be queued"""
+        if not self.has_capacity():
+            self.rejected += 1
+            raise OverloadedError(f"LLM backend '{self.name}' is busy, please retry shortly")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one generation slot for the duration of the block"""
+        self.check_capacity()
+        semaphore = self._get_semaphore()
+
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(f"Timed out waiting for LLM backend '{self.name}'")
+        finally:
+            self.waiting -= 1
+            waited = time.perf_counter() - queued_at
+            self.recent_wait += WAIT_AVERAGE_WEIGHT * (waited - self.recent_wait)
+            metrics.stage_duration.observe(waited, "llm_queue")
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        """Return current scheduler load"""
+        return {
+            "backend": self.name,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "recent_wait": round(self.recent_wait, 3),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue
+        }
+
+
+class LLMBackend:
+    """One LLM endpoint with its own scheduler, per-model clients and health state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.scheduler = LLMScheduler(self.url, LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
+        self.healthy = True
+        self.failures = 0
+        self.served = 0
+        self._llms = {}
+        self._recent_prompts = deque(maxlen=LLM_PREFIX_WINDOW)
+
+    def llm(self, model: str, chat: bool = False):
+        """Client for one model; kept for the process lifetime so HTTP connections are reused"""
+        if (model, chat) not in self._llms:
+            self._llms[(model, chat)] = create_llm(self.url, model, chat)
+        return self._llms[(model, chat)]
+
+    def prefill_tokens(self, prompt: str) -> int:
+        """Estimate the prompt tokens this backend must prefill, given the prefixes it recently cached"""
+        shared = max((len(os.path.commonprefix([prompt, p])) for p in self._recent_prompts), default=0)
+        self._recent_prompts.append(prompt)
+        return metrics.estimate_tokens(prompt[shared:])
+
+    @property
+    def load(self) -> float:
+        """Outstanding requests (running and queued) relative to this backend's slots"""
+        return (self.scheduler.active + self.scheduler.waiting) / self.scheduler.max_concurrency
+
+    def mark_ok(self) -> None:
+        self.served += 1
+        if not self.healthy:
+            print(f"LLM backend {self.url} recovered")
+        self.healthy = True
+        metrics.backend_requests.inc(self.url, "ok")
+
+    def mark_failed(self, error: BaseException) -> None:
+        self.failures += 1
+        if self.healthy:
+            print(f"LLM backend {self.url} failed, taking it out of rotation: {error!r}")
+        self.healthy = False
+        metrics.backend_requests.inc(self.url, "error")
+
+    async def check_health(self, client: httpx.AsyncClient) -> None:
+        """Probe the Ollama API; a backend only rejoins the rotation once this succeeds"""
+        if LLM_BACKEND == "fake":
+            return
+        try:
+            healthy = (await client.get(f"{self.url}/api/tags")).status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != self.healthy:
+            print(f"LLM backend {self.url} is {'healthy' if healthy else 'unreachable'}")
+        self.healthy = healthy
+
+    def stats(self) -> dict:
+        return {
+            **self.scheduler.stats(),
+            "healthy": self.healthy,
+            "served": self.served,
+            "failures": self.failures,
+            "models": sorted({model for model, _ in self._llms})
+        }
+
+
+class LLMPool:
+    """Routes each generation to the least loaded healthy backend"""
+
+    def __init__(self, urls: list):
+        self.backends = [LLMBackend(url) for url in urls]
+        self.rejected = 0
+
+    def pick(self, exclude: tuple = (), prefer: LLMBackend = None) -> LLMBackend:
+        """
+        Choose the backend with the fewest outstanding requests per slot
+
+        Unhealthy backends are only used when no healthy one can take the request. A preferred
+        backend wins unless it is more than one request per slot busier than the least loaded.
+        """
+        candidates = [b for b in self.backends if b not in exclude and b.scheduler.has_capacity()]
+        if not candidates:
+            self.rejected += 1
+            raise OverloadedError("All LLM backends are busy, please retry shortly")
+        healthy = [b for b in candidates if b.healthy] or candidates
+        best = min(healthy, key=lambda b: b.load)
+        if prefer in healthy and prefer.load < best.load + 1:
+            return prefer
+        return best
+
+    def affine(self, key: str) -> LLMBackend:
+        """Stable backend for a key (rendezvous hashing), so related prompts share one KV cache"""
+        return max(self.backends, key=lambda b: hashlib.sha256(f"{key}|{b.url}".encode("utf-8")).digest())
+
+    def can_failover(self, tried: list) -> bool:
+        return len(tried) <= LLM_FAILOVER_ATTEMPTS and any(
+            b not in tried and b.scheduler.has_capacity() for b in self.backends
+        )
+
+    def check_capacity(self) -> None:
+        """Raise OverloadedError if no backend could even queue a new request"""
+        if not any(b.scheduler.has_capacity() for b in self.backends):
+            self.rejected += 1
+            raise OverloadedError("All LLM backends are busy, please retry shortly")
+
+    def stats(self) -> dict:
+        """Return load summed over the pool plus a per-backend breakdown"""
+        backends = [b.stats() for b in self.backends]
+        return {
+            "active": sum(b["active"] for b in backends),
+            "waiting": sum(b["waiting"] for b in backends),
+            "rejected": self.rejected + sum(b["rejected"] for b in backends),
+            "max_concurrency": sum(b["max_concurrency"] for b in backends),
+            "max_queue": sum(b["max_queue"] for b in backends),
+            "healthy_backends": sum(b["healthy"] for b in backends),
+            "backends": backends
+        }
+
+
+pool = LLMPool(LLM_BACKEND_URLS)
+
+
+def model_for(stage: str) -> str:
+    return LLM_STAGE_MODELS.get(stage, LLM_MODEL)
+
+
+def _render(payload) -> str:
+    """Prompt text as the backend sees it, for token estimates"""
+    if isinstance(payload, str):
+        return payload
+    return "\n".join(f"{role}: {content}" for role, content in payload)
+
+
+def _text(output) -> str:
+    # Chat models return message objects, completion models plain strings
+    return str(getattr(output, "content", output))
+
+
+async def health_checker():
+    """Probe every backend periodically so failed ones rejoin the pool once they recover"""
+    async with httpx.AsyncClient(timeout=5) as client:
+        while True:
+            await asyncio.gather(*(backend.check_health(client) for backend in pool.backends))
+            await asyncio.sleep(LLM_HEALTH_CHECK_INTERVAL)
+
+
+async def _invoke(payload, stage: str, affinity: str = None, chat: bool = False) -> str:
+    model = model_for(stage)
+    prompt = _render(payload)
+    prefer = pool.affine(affinity) if affinity else None
+    tried = []
+    while True:
+        backend = pool.pick(tried, prefer)
+        tried.append(backend)
+        async with backend.scheduler.slot():
+            prefill = backend.prefill_tokens(prompt)
+            start = time.perf_counter()
+            try:
+                response = _text(await asyncio.wait_for(backend.llm(model, chat).ainvoke(payload), LLM_REQUEST_TIMEOUT))
+            except asyncio.CancelledError:
+                metrics.record_cancelled(stage)
+                raise
+            except Exception as e:
+                metrics.record_error(stage, e)
+                backend.mark_failed(e)
+                if not pool.can_failover(tried):
+                    raise
+                continue
+        backend.mark_ok()
+        metrics.record_llm_call(
+            stage, prompt, response, time.perf_counter() - start, backend=backend.url, prefill=prefill
+        )
+        return response
+
+
+async def _stream(payload, stage: str, affinity: str = None, chat: bool = False):
+    model = model_for(stage)
+    prompt = _render(payload)
+    prefer = pool.affine(affinity) if affinity else None
+    tried = []
+    while True:
+        backend = pool.pick(tried, prefer)
+        tried.append(backend)
+        async with backend.scheduler.slot():
+            prefill = backend.prefill_tokens(prompt)
+            start = time.perf_counter()
+            ttft = None
+            completion = []
+            chunks = backend.llm(model, chat).astream(payload).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = _text(await asyncio.wait_for(chunks.__anext__(), LLM_REQUEST_TIMEOUT))
+                    except StopAsyncIteration:
+                        break
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    completion.append(chunk)
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                # The consumer went away; closing the stream below aborts the generation on the backend
+                metrics.record_cancelled(stage, "".join(completion))
+                raise
+            except Exception as e:
+                metrics.record_error(stage, e)
+                backend.mark_failed(e)
+                if completion or not pool.can_failover(tried):
+                    raise
+                continue
+            finally:
+                await chunks.aclose()
+        backend.mark_ok()
+        metrics.record_llm_call(
+            stage, prompt, "".join(completion), time.perf_counter() - start, ttft,
+            backend=backend.url, prefill=prefill
+        )
+        return
+
+
+async def ainvoke(prompt: str, stage: str = "llm") -> str:
+    """Run one non-streaming generation, failing over to another backend on error or timeout"""
+    return await _invoke(prompt, stage)
+
+
+def astream(prompt: str, stage: str = "llm"):
+    """
+    Stream one generation, holding a backend slot until it finishes
+
+    A backend that errors or stalls before the first token is failed over like ainvoke.
+    Once tokens have been sent the error is raised, since they cannot be taken back.
+    """
+    return _stream(prompt, stage)
+
+
+async def achat(messages: list, stage: str = "llm", affinity: str = None) -> str:
+    """
+    Run one chat turn given (role, content) messages
+
+    Calls with the same affinity key go to the same backend while it is healthy and not
+    overloaded, so a conversation's earlier turns stay in one KV cache.
+    """
+    return await _invoke(messages, stage, affinity, chat=True)
+
+
+def astream_chat(messages: list, stage: str = "llm", affinity: str = None):
+    """Stream one chat turn, with the same backend affinity as achat"""
+    return _stream(messages, stage, affinity, chat=True)
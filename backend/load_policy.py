@@ -0,0 +1,72 @@
+"""
+Load-aware choice between the full explanation pipeline and a cheaper degraded one
+"""
+import metrics
+import llm_client
+from config import DEGRADE_MODE, DEGRADE_QUEUE_RATIO, DEGRADE_QUEUE_WAIT, DEGRADE_RECOVERY
+
+MODES = ("full", "degraded")
+
+
+class LoadPolicy:
+    """
+    Picks the pipeline mode for each new explanation from the LLM pool's queue
+
+    Degraded mode starts when the share of queue slots in use reaches queue_ratio or the average
+    wait for a slot reaches queue_wait. It ends once both are below recovery times their
+    threshold, so the mode does not flap around a single threshold.
+    """
+
+    def __init__(self, pool: llm_client.LLMPool, queue_ratio: float = DEGRADE_QUEUE_RATIO,
+                 queue_wait: float = DEGRADE_QUEUE_WAIT, recovery: float = DEGRADE_RECOVERY,
+                 pinned: str = DEGRADE_MODE):
+        self.pool = pool
+        self.queue_ratio = queue_ratio
+        self.queue_wait = queue_wait
+        self.recovery = recovery
+        self.pinned = pinned if pinned in MODES else None
+        self.degraded = False
+        self.switches = 0
+        self.requests = dict.fromkeys(MODES, 0)
+
+    def load(self) -> tuple:
+        """Return (share of queue slots in use, longest average wait of a healthy backend)"""
+        schedulers = [b.scheduler for b in self.pool.backends]
+        queue = sum(s.waiting for s in schedulers) / max(sum(s.max_queue for s in schedulers), 1)
+        healthy = [b.scheduler for b in self.pool.backends if b.healthy] or schedulers
+        return queue, max(s.recent_wait for s in healthy)
+
+    def mode(self) -> str:
+        """Choose and count the mode of an explanation starting now: "full" or "degraded" """
+        mode = self.pinned or self._follow_load()
+        self.requests[mode] += 1
+        metrics.explain_mode.inc(mode)
+        return mode
+
+    def _follow_load(self) -> str:
+        queue, wait = self.load()
+        if self.degraded:
+            overloaded = queue >= self.queue_ratio * self.recovery or wait >= self.queue_wait * self.recovery
+        else:
+            overloaded = queue >= self.queue_ratio or wait >= self.queue_wait
+        if overloaded != self.degraded:
+            self.degraded = overloaded
+            self.switches += 1
+            print(f"Explanations switched to {'degraded' if overloaded else 'full'} mode "
+                  f"(queue {queue:.0%}, average wait {wait:.2f}s)")
+        return "degraded" if self.degraded else "full"
+
+    def stats(self) -> dict:
+        queue, wait = self.load()
+        return {
+            "mode": self.pinned or ("degraded" if self.degraded else "full"),
+            "pinned": self.pinned is not None,
+            "queue": round(queue, 3),
+            "recent_wait": round(wait, 3),
+            "switches": self.switches,
+            "requests": dict(self.requests)
+        }
+
+
+# Initialize the policy
+load_policy = LoadPolicy(llm_client.pool)
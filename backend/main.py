@@ -1,9 +1,17 @@
 """
 Main FastAPI application for Explain Like I'm 10
 """
-from fastapi import FastAPI
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from routes import router
+from warmup import router as warmup_router
+from tts import audio_sweeper
+from llm_client import OverloadedError, health_checker
+import metrics
 from config import (
     CORS_ORIGINS, 
     CORS_CREDENTIALS, 
@@ -12,8 +20,18 @@ from config import (
     CORS_EXPOSE_HEADERS
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background tasks"""
+    sweeper = asyncio.create_task(audio_sweeper())
+    health = asyncio.create_task(health_checker())
+    yield
+    sweeper.cancel()
+    health.cancel()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Explain Like I'm 10")
+app = FastAPI(title="Explain Like I'm 10", lifespan=lifespan)
 
 # Add CORS middleware - must be before routes
 app.add_middleware(
@@ -25,8 +43,30 @@ app.add_middleware(
     expose_headers=["*"]  # Expose all headers
 )
 
+@app.middleware("http")
+async def tag_request(request: Request, call_next):
+    """Give every request an id so its stage traces can be grouped"""
+    token = metrics.request_id.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12])
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = metrics.request_id.get()
+        return response
+    finally:
+        metrics.request_id.reset(token)
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Tell clients to back off when the LLM queue is full"""
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(exc)},
+        headers={"Retry-After": "5", "Access-Control-Allow-Origin": "*"}
+    )
+
+
 # Include API routes
 app.include_router(router)
+app.include_router(warmup_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+"""
+Lightweight latency, token and error instrumentation with Prometheus text export
+"""
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from config import METRICS_TRACE_LOG
+
+# Seconds; covers token latencies up to full multi-stage generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Set per HTTP request so trace lines from every stage can be grouped
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (roughly 4 characters per token)"""
+    return len(text) // 4
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram with labels"""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labels + ("le",), values + (le,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+stage_duration = Histogram("eli10_stage_duration_seconds", "Wall time per pipeline stage", ("stage",))
+stage_ttft = Histogram("eli10_stage_ttft_seconds", "Time to first token per streaming stage", ("stage",))
+prompt_tokens = Counter("eli10_prompt_tokens_total", "Estimated prompt tokens sent to the LLM", ("stage",))
+completion_tokens = Counter("eli10_completion_tokens_total", "Estimated completion tokens from the LLM", ("stage",))
+prefill_tokens = Counter(
+    "eli10_prefill_tokens_total", "Estimated prompt tokens not covered by a prefix the backend had cached", ("stage",)
+)
+stage_errors = Counter("eli10_stage_errors_total", "Errors per pipeline stage", ("stage",))
+stage_cancelled = Counter(
+    "eli10_stage_cancelled_total", "LLM generations and syntheses abandoned before finishing", ("stage",)
+)
+streams_cancelled = Counter("eli10_streams_cancelled_total", "Explanation streams stopped early", ("reason",))
+explain_mode = Counter("eli10_explain_mode_total", "Explanations generated per pipeline mode", ("mode",))
+local_safety = Counter(
+    "eli10_local_safety_checks_total", "Sections checked by the local safety filter, by result", ("result",)
+)
+backend_requests = Counter("eli10_llm_backend_requests_total", "LLM calls per pool backend", ("backend", "outcome"))
+
+REGISTRY = [
+    stage_duration, stage_ttft, prompt_tokens, completion_tokens, prefill_tokens, stage_errors, stage_cancelled,
+    streams_cancelled, explain_mode, local_safety, backend_requests
+]
+
+
+def trace(event: str, **fields) -> None:
+    """Print one structured trace line for the current request when METRICS_TRACE_LOG is on"""
+    if METRICS_TRACE_LOG:
+        print(json.dumps({"trace": event, "request_id": request_id.get(), "ts": round(time.time(), 3), **fields}))
+
+
+def record_llm_call(
+    stage: str, prompt: str, completion: str, duration: float, ttft: float = None, backend: str = None,
+    prefill: int = None
+) -> None:
+    """Record one finished LLM call"""
+    stage_duration.observe(duration, stage)
+    if ttft is not None:
+        stage_ttft.observe(ttft, stage)
+    prompt_count = estimate_tokens(prompt)
+    completion_count = estimate_tokens(completion)
+    prompt_tokens.inc(stage, amount=prompt_count)
+    completion_tokens.inc(stage, amount=completion_count)
+    prefill_tokens.inc(stage, amount=prompt_count if prefill is None else prefill)
+    trace(
+        "llm", stage=stage, duration=round(duration, 4), ttft=round(ttft, 4) if ttft is not None else None,
+        prompt_tokens=prompt_count, completion_tokens=completion_count, prefill_tokens=prefill, backend=backend
+    )
+
+
+def record_error(stage: str, error: BaseException) -> None:
+    stage_errors.inc(stage)
+    trace("error", stage=stage, error=repr(error))
+
+
+def record_cancelled(stage: str, partial: str = "") -> None:
+    """Record a stage abandoned because nobody was waiting for its output any more"""
+    stage_cancelled.inc(stage)
+    trace("cancelled", stage=stage, completion_tokens=estimate_tokens(partial))
+
+
+@contextmanager
+def track(stage: str):
+    """Time a block as one stage and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record_error(stage, e)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stage_duration.observe(duration, stage)
+        trace("stage", stage=stage, duration=round(duration, 4))
+
+
+def gauge_lines(name: str, help_text: str, value: float, kind: str = "gauge") -> list:
+    """Render a single unlabelled value sampled at scrape time"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+def render(extra_lines: list = ()) -> str:
+    """Render every registered metric in Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,9 @@
 """
 Data models for the Explain Like I'm 10 API
 """
-from pydantic import BaseModel
-from typing import TypedDict, Literal
+from pydantic import BaseModel, Field
+from typing import TypedDict, Literal, List, Optional
+from config import BULK_EXPLAIN_MAX_ITEMS, QUIZ_BATCH_MAX_ANSWERS
 
 
 class ExplainRequest(BaseModel):
@@ -11,6 +12,19 @@ class ExplainRequest(BaseModel):
     age: int
     context: str = ""  # Conversation history
     mode: Literal["explain", "quiz"] = "explain"  # Mode: explain or quiz
+    session_id: Optional[str] = None  # Use and extend the server-side history instead of context
+
+
+class BulkExplainItem(BaseModel):
+    """One topic of a bulk explain request"""
+    topic: str
+    age: int
+
+
+class BulkExplainRequest(BaseModel):
+    """Request model for the /explain/bulk endpoint"""
+    items: List[BulkExplainItem] = Field(min_length=1, max_length=BULK_EXPLAIN_MAX_ITEMS)
+    concurrency: Optional[int] = None  # Items generated in parallel, defaults to BULK_EXPLAIN_CONCURRENCY
 
 
 class QuizRequest(BaseModel):
@@ -19,6 +33,7 @@ class QuizRequest(BaseModel):
     age: int
     num_questions: int = 5
     difficulty: Literal["easy", "medium", "hard"] = "medium"
+    user_id: Optional[str] = None  # Skip banked questions this user has already seen
 
 
 class QuizAnswerRequest(BaseModel):
@@ -27,6 +42,26 @@ class QuizAnswerRequest(BaseModel):
     correct_answer: str
     user_answer: str
     age: int
+    options: Optional[dict] = None  # Options returned by /quiz/generate, to score answers given as option text
+    explanation: str = ""  # Explanation returned by /quiz/generate for this question
+    llm_feedback: bool = False  # Ask the LLM to word the feedback instead of using a template
+
+
+class QuizAnswer(BaseModel):
+    """One answered question in a submitted quiz"""
+    question: str
+    correct_answer: str
+    user_answer: str
+    options: Optional[dict] = None
+    explanation: str = ""
+
+
+class QuizSubmission(BaseModel):
+    """Request model for scoring a whole quiz at once"""
+    topic: str
+    age: int
+    answers: List[QuizAnswer] = Field(max_length=QUIZ_BATCH_MAX_ANSWERS)
+    llm_summary: bool = False  # Ask the LLM for one combined summary instead of a template
 
 
 class ExplainState(TypedDict):
@@ -35,6 +70,7 @@ class ExplainState(TypedDict):
     age: int
     context: str
     intent: str  # 'new_question', 'answer', or 'followup'
+    mode: str  # 'full', or 'degraded' when the LLM pool is overloaded
     simplified: str
     example: str
     safe_text: str
@@ -0,0 +1,62 @@
+"""
+Persistent store of pre-generated topic pack answers
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+from config import PACK_STORE_PATH
+
+
+class PackStore:
+    """SQLite-backed store of explanations and quizzes keyed like the caches"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (kind, key))"
+            )
+            self._conn.commit()
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        """Return the stored payload, or None if this item was never generated"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM items WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def has(self, kind: str, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM items WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return row is not None
+
+    def put(self, kind: str, key: str, payload: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO items (kind, key, payload, created) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), time.time())
+            )
+            self._conn.commit()
+
+    def keys(self, kind: str) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM items WHERE kind = ?", (kind,)).fetchall()
+        return [key for key, in rows]
+
+    def count(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, COUNT(*) FROM items GROUP BY kind").fetchall()
+        return dict(rows)
+
+
+# Initialize the store
+pack_store = PackStore(PACK_STORE_PATH)
@@ -0,0 +1,59 @@
+"""
+Pre-emption of a session's running stream when the same session starts a new one
+"""
+import asyncio
+
+
+class StreamPreemption:
+    """Tracks the running stream of each session and stops it when a newer one claims the session"""
+
+    def __init__(self):
+        self.preempted = 0
+        self._active = {}
+
+    def claim(self, key: str) -> asyncio.Event:
+        """
+        Register a new stream for key, signalling the previous one to stop
+
+        Returns:
+            asyncio.Event: Set when a newer stream claims the same key
+        """
+        previous = self._active.get(key)
+        if previous is not None:
+            previous.set()
+            self.preempted += 1
+        stop = asyncio.Event()
+        self._active[key] = stop
+        return stop
+
+    def release(self, key: str, stop: asyncio.Event) -> None:
+        if self._active.get(key) is stop:
+            del self._active[key]
+
+    def stats(self) -> dict:
+        return {"active": len(self._active), "preempted": self.preempted}
+
+
+async def until_set(source, stop: asyncio.Event):
+    """Yield events from source until stop is set, then abandon the source mid-wait"""
+    events = source.__aiter__()
+    stopped = asyncio.ensure_future(stop.wait())
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({pending, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                return
+
+            fetched, pending = pending, None
+            try:
+                event = fetched.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        stopped.cancel()
+        if pending is not None:
+            # Cancelling the read lets the source release what it holds (e.g. its LLM stream)
+            pending.cancel()
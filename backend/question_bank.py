@@ -0,0 +1,98 @@
+"""
+Reusable bank of generated quiz questions
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+from cache import normalize_topic, age_band, KEY_PREFIX
+from config import QUESTION_BANK_PATH
+
+
+def bank_index(topic: str, age: int, difficulty: str) -> tuple:
+    """
+    Build the (topic, band, difficulty) index of banked questions under the current model and prompts
+
+    The topic carries KEY_PREFIX like the cache keys, so questions banked by another model or
+    PROMPT_VERSION are never served.
+    """
+    return f"{KEY_PREFIX}{normalize_topic(topic)}", age_band(age), difficulty
+
+
+class QuestionBank:
+    """SQLite store of quiz questions indexed by (model and prompt version + topic, age band, difficulty)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "id INTEGER PRIMARY KEY, topic TEXT NOT NULL, band TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "normalized TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "UNIQUE (topic, band, difficulty, normalized));"
+                "CREATE TABLE IF NOT EXISTS seen ("
+                "user_id TEXT NOT NULL, question_id INTEGER NOT NULL, PRIMARY KEY (user_id, question_id));"
+            )
+            self._conn.commit()
+
+    def add(self, topic: str, age: int, difficulty: str, questions: list) -> list:
+        """
+        Store questions, ignoring any whose normalized text is already banked
+
+        Returns:
+            list: Bank ids of the given questions, in order
+        """
+        index = bank_index(topic, age, difficulty)
+        ids = []
+        with self._lock:
+            for question in questions:
+                normalized = normalize_topic(question["question"])
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO questions (topic, band, difficulty, normalized, payload, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (*index, normalized, json.dumps(question), time.time())
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM questions WHERE topic = ? AND band = ? AND difficulty = ? AND normalized = ?",
+                    (*index, normalized)
+                ).fetchone()
+                ids.append(row[0])
+            self._conn.commit()
+        return ids
+
+    def sample(self, topic: str, age: int, difficulty: str, count: int, user_id: Optional[str] = None) -> list:
+        """
+        Pick up to count random banked questions, skipping ones this user has already seen
+
+        Returns:
+            list: (id, question) pairs
+        """
+        index = bank_index(topic, age, difficulty)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM questions "
+                "WHERE topic = ? AND band = ? AND difficulty = ? "
+                "AND id NOT IN (SELECT question_id FROM seen WHERE user_id = ?) "
+                "ORDER BY RANDOM() LIMIT ?",
+                (*index, user_id or "", count)
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def mark_seen(self, user_id: str, question_ids: list) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen (user_id, question_id) VALUES (?, ?)",
+                [(user_id, question_id) for question_id in question_ids]
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+
+# Initialize the bank
+question_bank = QuestionBank(QUESTION_BANK_PATH)
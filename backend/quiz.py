@@ -0,0 +1,360 @@
+"""
+Quiz prompts, incremental parsing and per-question validation
+"""
+import re
+import json
+from typing import Optional
+import llm_client
+from config import QUIZ_REGENERATE_ATTEMPTS
+
+DIFFICULTY_MAP = {
+    "easy": "simple, straightforward questions",
+    "medium": "moderate difficulty with some critical thinking",
+    "hard": "challenging questions requiring deep understanding"
+}
+
+QUESTION_FORMAT = """{
+    "question": "Question text here?",
+    "options": {
+      "A": "Option A text",
+      "B": "Option B text",
+      "C": "Option C text",
+      "D": "Option D text"
+    },
+    "correct": "A",
+    "explanation": "Brief explanation of the correct answer"
+  }"""
+
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+
+def quiz_prompt(topic: str, age: int, num_questions: int, difficulty: str) -> str:
+    """Build the prompt asking for a whole quiz as a JSON array"""
+    return f"""
+Generate {num_questions} multiple-choice quiz questions about "{topic}" for someone who is {age} years old.
+
+Difficulty: {DIFFICULTY_MAP[difficulty]}
+
+For each question, provide:
+1. The question text
+2. Four answer options (A, B, C, D)
+3. The correct answer (letter only)
+4. A brief explanation
+
+Format as JSON array:
+[
+  {QUESTION_FORMAT}
+]
+
+Make questions age-appropriate for {age} years old.
+"""
+
+
+def single_question_prompt(topic: str, age: int, difficulty: str, avoid: list) -> str:
+    """Build the prompt asking for one replacement question"""
+    avoid_text = "\n".join(f"- {q}" for q in avoid) or "- (none)"
+    return f"""
+Generate ONE multiple-choice quiz question about "{topic}" for someone who is {age} years old.
+
+Difficulty: {DIFFICULTY_MAP[difficulty]}
+
+Do not repeat any of these questions:
+{avoid_text}
+
+Format as a single JSON object:
+{QUESTION_FORMAT}
+
+Respond with ONLY the JSON object.
+"""
+
+
+class JsonObjectScanner:
+    """Incrementally extract complete top-level JSON objects from streamed text"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> list:
+        """Add streamed text and return the source of every object completed by it"""
+        self._buffer += text
+        objects = []
+
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = self._position
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(self._buffer[self._start:self._position + 1])
+            self._position += 1
+
+        # Drop consumed text between objects so the buffer stays small
+        if self._depth == 0:
+            self._buffer = ""
+            self._position = 0
+        return objects
+
+
+def load_json_object(text: str) -> Optional[dict]:
+    """Parse one JSON object, repairing common model mistakes like trailing commas"""
+    for candidate in (text, re.sub(r",\s*([}\]])", r"\1", text)):
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def normalize_question(raw: dict) -> Optional[dict]:
+    """
+    Validate one question and repair its shape where the intent is unambiguous
+
+    Returns:
+        dict: The question in the documented format, or None if it cannot be repaired
+    """
+    raw = {str(k).strip().lower(): v for k, v in raw.items()}
+
+    question = raw.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return None
+
+    options = raw.get("options")
+    if isinstance(options, list) and len(options) == 4:
+        options = dict(zip(OPTION_LETTERS, options))
+    if not isinstance(options, dict):
+        return None
+    options = {str(k).strip().rstrip(").:").upper(): str(v).strip() for k, v in options.items()}
+    if sorted(options) != list(OPTION_LETTERS) or not all(options.values()):
+        return None
+
+    correct = str(raw.get("correct", raw.get("answer", ""))).strip()
+    letter = correct[:1].upper()
+    if letter not in OPTION_LETTERS or (len(correct) > 1 and correct[1].isalnum()):
+        # Model answered with the option text instead of the letter
+        matches = [k for k, v in options.items() if v.lower() == correct.lower()]
+        if len(matches) != 1:
+            return None
+        letter = matches[0]
+
+    return {
+        "question": question.strip(),
+        "options": {k: options[k] for k in OPTION_LETTERS},
+        "correct": letter,
+        "explanation": str(raw.get("explanation", "")).strip()
+    }
+
+
+def parse_questions(response: str) -> list:
+    """Extract every valid question from a full model response, skipping malformed ones"""
+    questions = []
+    for source in JsonObjectScanner().feed(response):
+        raw = load_json_object(source)
+        question = normalize_question(raw) if raw else None
+        if question:
+            questions.append(question)
+    return questions
+
+
+async def regenerate_question(topic: str, age: int, difficulty: str, avoid: list) -> Optional[dict]:
+    """Ask for one replacement question, retrying up to QUIZ_REGENERATE_ATTEMPTS times"""
+    for _ in range(QUIZ_REGENERATE_ATTEMPTS):
+        response = await llm_client.ainvoke(single_question_prompt(topic, age, difficulty, avoid), stage="quiz_regenerate")
+        for question in parse_questions(response):
+            if question["question"] not in avoid:
+                return question
+    return None
+
+
+async def stream_quiz(topic: str, age: int, num_questions: int, difficulty: str):
+    """
+    Stream quiz questions as soon as each one is complete and validated
+
+    Malformed or duplicate questions are skipped instead of failing the whole quiz,
+    and the shortfall is regenerated one question at a time after the main generation.
+    """
+    scanner = JsonObjectScanner()
+    seen = []
+
+    def accept(question: Optional[dict]):
+        if question and question["question"] not in seen and len(seen) < num_questions:
+            seen.append(question["question"])
+            return {"type": "question", "index": len(seen) - 1, "question": question}
+        return None
+
+    async for chunk in llm_client.astream(quiz_prompt(topic, age, num_questions, difficulty), stage="quiz_generate"):
+        for source in scanner.feed(chunk):
+            raw = load_json_object(source)
+            # Malformed questions are replaced after the stream so we never hold two LLM slots
+            event = accept(normalize_question(raw) if raw else None)
+            if event:
+                yield event
+
+    while len(seen) < num_questions:
+        event = accept(await regenerate_question(topic, age, difficulty, seen))
+        if event is None:
+            yield {"type": "error", "message": f"Could only generate {len(seen)} of {num_questions} questions"}
+            break
+        yield event
+
+
+ANSWER_LETTER = re.compile(r"^\s*([A-D])\s*[).:]?\s*$", re.IGNORECASE)
+
+
+def answer_letter(answer: str, options: Optional[dict] = None) -> Optional[str]:
+    """
+    Normalize a multiple-choice answer like "b", "B)" or " B. " to its letter
+
+    Anything longer ("Apple", "Because...") is only matched against the option texts, when given.
+
+    Returns:
+        The option letter, or None if the answer is not clearly one option
+    """
+    match = ANSWER_LETTER.match(answer)
+    if match:
+        return match.group(1).upper()
+    text = answer.strip().lower()
+    matches = [k for k, v in (options or {}).items() if str(v).strip().lower() == text]
+    return str(matches[0]).strip().upper() if len(matches) == 1 else None
+
+
+def is_correct_answer(user_answer: str, correct_answer: str, options: Optional[dict] = None) -> Optional[bool]:
+    """
+    Decide correctness locally, no LLM needed for a multiple-choice letter or option text
+
+    Returns:
+        Whether the answer is correct, or None if it cannot be decided without the LLM
+    """
+    user_letter = answer_letter(user_answer, options)
+    correct_letter = answer_letter(correct_answer, options)
+    if user_letter is None or correct_letter is None:
+        return None
+    return user_letter == correct_letter
+
+
+async def judge_answer(question: str, correct_answer: str, user_answer: str, options: Optional[dict] = None) -> bool:
+    """Ask the LLM whether a free-text answer means the same as the correct one"""
+    choices = "".join(f"\n{k}) {v}" for k, v in (options or {}).items())
+    prompt = f"""
+Question: {question}{choices}
+Correct Answer: {correct_answer}
+Student's Answer: {user_answer}
+
+Does the student's answer mean the same as the correct answer? Respond with ONLY "CORRECT" or "INCORRECT".
+"""
+    response = await llm_client.ainvoke(prompt, stage="quiz_judge")
+    return response.strip().upper().startswith("CORRECT")
+
+
+def judge_prompt(topic: str, age: int, answers: list, undecided: list, summary: bool) -> str:
+    """
+    Build one prompt that judges every free-text answer of a quiz, and optionally summarizes it
+
+    Args:
+        answers: The submitted QuizAnswer items
+        undecided: Indexes of the answers that could not be scored locally
+        summary: Also ask for the summary, so a whole quiz costs a single LLM call
+    """
+    lines = []
+    for i, answer in enumerate(answers):
+        choices = "; ".join(f"{k}) {v}" for k, v in (answer.options or {}).items())
+        lines.append(
+            f"{i + 1}. {answer.question}" + (f" [{choices}]" if choices else "")
+            + f" (student answered {answer.user_answer}, correct {answer.correct_answer})"
+            + (" [check]" if i in undecided else "")
+        )
+    results = "\n".join(lines)
+    summary_rule = (
+        f'\nThen write one line starting with "Summary:" and a short, encouraging summary for the student in '
+        f"2-3 sentences, appropriate for age {age}. Mention what they did well and one thing to review."
+    ) if summary else ""
+    return f"""
+A {age} year old student just finished a quiz about "{topic}".
+
+Results:
+{results}
+
+For every answer marked [check], decide whether the student's answer means the same as the correct answer.
+Write one line per checked answer in the form "2: CORRECT" or "2: INCORRECT".{summary_rule}
+"""
+
+
+def parse_judgement(response: str, undecided: list) -> tuple:
+    """
+    Read the verdicts and summary of a judge_prompt response
+
+    Returns:
+        tuple: (index -> verdict for every answer the response judged, summary or None)
+    """
+    verdicts = {}
+    for number, verdict in re.findall(r"(?im)^\W*(\d+)\s*[:.)-]\s*(INCORRECT|CORRECT)\b", response):
+        index = int(number) - 1
+        if index in undecided:
+            verdicts[index] = verdict.upper() == "CORRECT"
+    match = re.search(r"(?ims)^\W*summary:\s*(.+)", response)
+    return verdicts, match.group(1).strip() if match else None
+
+
+def feedback_message(is_correct: Optional[bool], age: int, correct_answer: str) -> str:
+    """Templated encouraging feedback in a register suited to the student's age"""
+    letter = answer_letter(correct_answer) or correct_answer.strip()
+    if is_correct is None:
+        # A free-text answer the LLM could not judge
+        return f"We couldn't check this answer. The correct answer is {letter}."
+    if age < 12:
+        if is_correct:
+            return "Great job! You got it right! 🎉"
+        return f"Nice try! The right answer is {letter}. Keep going, you're learning a lot!"
+    if age < 18:
+        if is_correct:
+            return "Correct, well done!"
+        return f"Not quite. The correct answer is {letter}, but good effort!"
+    if is_correct:
+        return "Correct."
+    return f"Incorrect. The correct answer is {letter}."
+
+
+def summary_message(score: int, total: int, age: int) -> str:
+    """Templated summary of a finished quiz"""
+    ratio = score / total if total else 0
+    if ratio == 1:
+        message = "Perfect score!" if age >= 12 else "Perfect score! You're a superstar! ⭐"
+    elif ratio >= 0.6:
+        message = "Well done, you know this topic well." if age >= 12 else "Awesome work, you know a lot about this!"
+    else:
+        message = "Good effort, reviewing the explanations will help." if age >= 12 else "Good try! Let's read the explanations and try again!"
+    return f"You scored {score} out of {total}. {message}"
+
+
+def summary_prompt(topic: str, age: int, results: list) -> str:
+    """Build the prompt for one combined LLM summary of a whole quiz"""
+    lines = "\n".join(
+        f"- {r['question']} (student answered {r['user_answer']}, correct {r['correct_answer']})"
+        for r in results
+    )
+    return f"""
+A {age} year old student just finished a quiz about "{topic}".
+
+Results:
+{lines}
+
+Write a short, encouraging summary for the student in 2-3 sentences, appropriate for age {age}.
+Mention what they did well and one thing to review. Respond with ONLY the summary.
+"""
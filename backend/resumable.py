@@ -0,0 +1,79 @@
+"""
+Resumable event streams: numbered events buffered per stream so a client can reconnect with Last-Event-ID
+"""
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from singleflight import Broadcast
+from sse import sse_frame
+from config import STREAM_RESUME_TTL, STREAM_RESUME_GRACE, STREAM_RESUME_MAX
+
+
+class ResumableStreams:
+    """
+    Runs each response's event stream in the background and keeps its events for reconnects
+
+    Events are numbered from 1 and framed with the id "<stream id>:<number>". While no client
+    is connected the stream keeps running for grace seconds. Finished streams stay resumable
+    for ttl seconds, and at most max_streams are kept.
+    """
+
+    def __init__(self, ttl: float = STREAM_RESUME_TTL, grace: float = STREAM_RESUME_GRACE,
+                 max_streams: int = STREAM_RESUME_MAX):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_streams = max_streams
+        self.resumed = 0
+        self._streams = OrderedDict()
+        self._finished_at = {}
+
+    def start(self, source):
+        """Start buffering source and return the SSE frames of a first connection to it"""
+        self._evict()
+        stream_id = uuid.uuid4().hex
+        broadcast = Broadcast(source, self.grace)
+        self._streams[stream_id] = broadcast
+        broadcast.task.add_done_callback(lambda t: self._mark_finished(stream_id))
+        return self._frames(stream_id, broadcast, 0)
+
+    def resume(self, last_event_id: str) -> Optional[object]:
+        """
+        Continue a stream after the event a client last received
+
+        Returns:
+            The remaining SSE frames, or None if the stream is unknown or expired
+        """
+        stream_id, _, seq = last_event_id.strip().rpartition(":")
+        self._evict()
+        broadcast = self._streams.get(stream_id)
+        if broadcast is None or not seq.isdigit() or broadcast.cancelled:
+            return None
+        self.resumed += 1
+        return self._frames(stream_id, broadcast, min(int(seq), len(broadcast.events)))
+
+    async def _frames(self, stream_id: str, broadcast: Broadcast, start: int):
+        seq = start
+        async for event in broadcast.subscribe(start):
+            seq += 1
+            yield sse_frame(event, f"{stream_id}:{seq}")
+
+    def _mark_finished(self, stream_id: str) -> None:
+        if stream_id in self._streams:
+            self._finished_at[stream_id] = time.monotonic()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for stream_id, finished_at in list(self._finished_at.items()):
+            if now - finished_at > self.ttl:
+                self._forget(stream_id)
+        # Oldest first; a running stream dropped here keeps serving its current client
+        while len(self._streams) > self.max_streams:
+            self._forget(next(iter(self._streams)))
+
+    def _forget(self, stream_id: str) -> None:
+        self._streams.pop(stream_id, None)
+        self._finished_at.pop(stream_id, None)
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._streams), "resumed": self.resumed}
@@ -3,50 +3,300 @@ API route handlers
 """
 import os
 import json
-from fastapi import APIRouter, Response
-from fastapi.responses import FileResponse, StreamingResponse
-from models import ExplainRequest, QuizRequest, QuizAnswerRequest
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Optional
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from models import ExplainRequest, BulkExplainRequest, QuizRequest, QuizAnswerRequest, QuizSubmission
 from graph import explain_graph, stream_explain_graph
-from tts import text_to_speech
+from tts import text_to_speech, audio_file_name, find_audio, synthesis_in_progress
+from audio_serving import serve_audio
 from topic_packs import TOPIC_PACKS
-from config import AUDIO_DIR, llm
+from cache import explain_cache, cache_key, parse_cache_key, quiz_key, normalize_topic, replay_events
+from pack_store import pack_store
+from question_bank import question_bank
+from sessions import session_store
+from quiz import (
+    quiz_prompt,
+    parse_questions,
+    stream_quiz,
+    is_correct_answer,
+    judge_answer,
+    judge_prompt,
+    parse_judgement,
+    feedback_message,
+    summary_message,
+    summary_prompt
+)
+from singleflight import SingleFlight, StreamFanout
+from sse import sse_frame, coalesce
+from preemption import StreamPreemption, until_set
+from resumable import ResumableStreams
+from load_policy import load_policy
+from topic_index import topic_index
+from config import AUDIO_PROGRESSIVE, BULK_EXPLAIN_CONCURRENCY, BULK_EXPLAIN_MAX_CONCURRENCY, TOPIC_MATCH
+import llm_client
+import metrics
 
 import re
 
 router = APIRouter()
 
+# Identical concurrent requests share one generation
+explain_flight = SingleFlight()
+quiz_flight = SingleFlight()
+tts_flight = SingleFlight()
+stream_fanout = StreamFanout()
+stream_preemption = StreamPreemption()
+resumable_streams = ResumableStreams()
+
 
 @router.post("/explain")
-def explain(req: ExplainRequest):
+async def explain(req: ExplainRequest):
     """Generate an age-appropriate explanation with audio"""
-    result = explain_graph.invoke({
-        "topic": req.topic,
-        "age": req.age
-    })
+    key = cache_key(req.topic, req.age)
+    cached = await cached_explanation(req.topic, req.age)
+    if cached:
+        return cached
+
+    return await explain_flight.do(f"{key}|{req.mode}", lambda: generate_explanation(req, key))
+
+
+def stored_explanation(topic: str, age: int) -> Optional[dict]:
+    """
+    Find a cached or pre-generated answer for topic, or for a near-duplicate topic already answered
+
+    Returns:
+        The stored entry, with "matched_topic" set when it answers a different topic, or None
+    """
+    key = cache_key(topic, age)
+    entry = explain_cache.get(key) or pack_store.get("explain", key)
+    if entry or not TOPIC_MATCH:
+        return entry
+
+    match = topic_index.match(topic, age)
+    if match:
+        entry = explain_cache.get(match) or pack_store.get("explain", match)
+        if entry is None:
+            # The matched answer has expired or been evicted since it was indexed
+            topic_index.discard(match)
+        else:
+            # Tell the client which topic it is really getting ("showing results for ...")
+            entry = {**entry, "matched_topic": parse_cache_key(match)[1]}
+    return entry
+
+
+def remember_explanation(key: str, entry: dict) -> None:
+    """Cache a generated answer and index its topic for near-duplicate lookups"""
+    explain_cache.set(key, entry)
+    topic_index.add(key)
+
+
+async def cached_explanation(topic: str, age: int) -> Optional[dict]:
+    """Return a cached or pre-generated explanation with its audio URL, or None on a miss"""
+    cached = await asyncio.to_thread(stored_explanation, topic, age)
+    if not cached:
+        return None
+    result = {
+        "sections": cached["sections"],
+        "audio_url": await asyncio.to_thread(cached_audio_url, cached),
+        # Only full-mode answers are cached
+        "mode": "full"
+    }
+    if "matched_topic" in cached:
+        result["matched_topic"] = cached["matched_topic"]
+    return result
+
+
+@router.post("/explain/bulk")
+async def explain_bulk(req: BulkExplainRequest):
+    """Explain many topics in parallel, streaming NDJSON results in completion order"""
+    concurrency = max(1, min(req.concurrency or BULK_EXPLAIN_CONCURRENCY, BULK_EXPLAIN_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(index: int, item_req: ExplainRequest) -> dict:
+        item = {"type": "result", "index": index, "topic": item_req.topic, "age": item_req.age}
+        start = time.perf_counter()
+        try:
+            key = cache_key(item_req.topic, item_req.age)
+            result = await cached_explanation(item_req.topic, item_req.age)
+            item["cached"] = result is not None
+            if result is None:
+                async with semaphore:
+                    result = await explain_flight.do(
+                        f"{key}|{item_req.mode}",
+                        lambda: generate_explanation(item_req, key),
+                        cancel_abandoned=True
+                    )
+            item.update(result)
+        except Exception as e:
+            # One failed topic must not abort the rest of the lesson
+            print(f"Bulk explain failed for '{item_req.topic}' age {item_req.age}: {e}")
+            item.update(type="error", error=str(e))
+        item["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return item
+
+    async def ndjson_generator():
+        start = time.perf_counter()
+        tasks = [
+            asyncio.create_task(process(i, ExplainRequest(topic=item.topic, age=item.age)))
+            for i, item in enumerate(req.items)
+        ]
+        summary = {"type": "summary", "total": len(tasks), "succeeded": 0, "failed": 0, "cached": 0}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                if item["type"] == "result":
+                    summary["succeeded"] += 1
+                    summary["cached"] += item["cached"]
+                else:
+                    summary["failed"] += 1
+                yield json.dumps(item) + "\n"
+        finally:
+            # Client went away: stop generating the topics nobody will receive
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        summary["concurrency"] = concurrency
+        summary["elapsed_seconds"] = round(elapsed, 2)
+        summary["items_per_second"] = round(summary["succeeded"] / elapsed, 3) if elapsed else 0.0
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(
+        ndjson_generator(),
+        media_type="application/x-ndjson",
+        headers={"Access-Control-Allow-Origin": "*"}
+    )
+
+
+async def generate_explanation(req: ExplainRequest, key: str, mode: Optional[str] = None) -> dict:
+    """Run the explain graph and TTS for a cache miss, in the given mode or the one the load calls for"""
+    state = {"topic": req.topic, "age": req.age}
+    if mode:
+        state["mode"] = mode
+    with metrics.track("explain_graph"):
+        result = await explain_graph.ainvoke(state)
  
     output = result["output"]
-    display_sections_fomatted = {}
-    extract_useful_content(output["explanation"], display_sections_fomatted)
-    # print(f"Display sections formated: {display_sections_fomatted}")
-    
-    display_sections = {
-        "Explanation": display_sections_fomatted.get("Explanation", ""),
-        "Example": display_sections_fomatted.get("Example", "") if display_sections_fomatted.get("Example", "") else output["example"],
-        "Question": output["question"]
-    }
+    display_sections = clean_sections(output["explanation"], output["example"], output["question"])
 
     sections_text = "\n\n".join([f"{label}: {text}" for label, text in display_sections.items()])
-    audio_path = text_to_speech(sections_text)
+    audio_path = await asyncio.to_thread(text_to_speech, sections_text)
+    audio_url = f"/audio/{os.path.basename(audio_path)}"
+    # A degraded answer is not kept, so the topic gets a full answer once the load drops
+    if output["mode"] == "full":
+        remember_explanation(key, {"sections": display_sections, "audio_url": audio_url})
 
     return {
         "sections": display_sections,
-        "audio_url": f"/audio/{os.path.basename(audio_path)}"
+        "audio_url": audio_url,
+        "mode": output["mode"]
+    }
+
+
+def cached_audio_url(entry: dict) -> str:
+    """Return the audio URL of a cache entry, re-synthesizing it if the file is gone"""
+    audio_url = entry.get("audio_url")
+    if audio_url and find_audio(audio_url):
+        return audio_url
+
+    sections_text = "\n\n".join([f"{label}: {text}" for label, text in entry["sections"].items() if text])
+    audio_path = text_to_speech(sections_text)
+    entry["audio_url"] = f"/audio/{os.path.basename(audio_path)}"
+    return entry["audio_url"]
+
+
+async def synthesize(audio_text: str) -> str:
+    """Run text_to_speech in a thread, stopping it between gTTS requests if this task is cancelled"""
+    abort = threading.Event()
+    try:
+        return await asyncio.to_thread(text_to_speech, audio_text, abort=abort)
+    except asyncio.CancelledError:
+        abort.set()
+        raise
+
+
+async def synthesize_section(section: str, text: str, progressive: bool = False):
+    """
+    Synthesize one section off the event loop and build its audio event
+
+    With progressive set, the event is returned as soon as the MP3 starts being written,
+    and /audio streams the bytes while the rest is still being synthesized.
+    Cancelling this before the audio is ready also stops the synthesis, unless another
+    request is waiting for the same audio.
+    """
+    audio_text = f"{section}: {text}"
+    file_name = audio_file_name(audio_text)
+    synthesis = asyncio.ensure_future(
+        tts_flight.do(audio_text, lambda: synthesize(audio_text), cancel_abandoned=True)
+    )
+    try:
+        if progressive:
+            while not synthesis.done() and not synthesis_in_progress(file_name):
+                await asyncio.sleep(0.01)
+            if not synthesis.done():
+                synthesis.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return {"type": "audio", "section": section, "url": f"/audio/{file_name}"}
+        audio_path = await synthesis
+    except asyncio.CancelledError:
+        synthesis.cancel()
+        raise
+    except Exception as e:
+        print(f"Error generating audio for {section}: {e}")
+        return None
+    return {
+        "type": "audio",
+        "section": section,
+        "url": f"/audio/{os.path.basename(audio_path)}"
     }
 
 
 @router.post("/explain/stream")
-async def explain_stream(req: ExplainRequest):
+async def explain_stream(req: ExplainRequest, request: Request):
     """Stream age-appropriate explanation in real-time"""
+    # A reconnecting client continues its earlier stream instead of starting a new generation
+    last_event_id = request.headers.get("last-event-id")
+    resumed = resumable_streams.resume(last_event_id) if last_event_id else None
+    if resumed:
+        return event_stream_response(resumed)
+
+    if req.session_id:
+        history = await asyncio.to_thread(session_store.context, req.session_id)
+        req = req.model_copy(update={"context": history})
+
+    # Only context-free requests are new questions and safe to serve from cache
+    key = cache_key(req.topic, req.age) if not req.context else None
+    cached = await asyncio.to_thread(stored_explanation, req.topic, req.age) if key else None
+    if not cached:
+        # Reject up front while we can still send a 503 instead of a broken stream
+        llm_client.pool.check_capacity()
+
+    async def replay_generator():
+        for chunk in replay_events(cached):
+            yield chunk
+
+        # Synthesize every section at once and send each audio event as soon as it is ready
+        audio_tasks = [
+            asyncio.create_task(synthesize_section(section, text, AUDIO_PROGRESSIVE))
+            for section, text in cached["sections"].items() if text
+        ]
+        try:
+            for task in asyncio.as_completed(audio_tasks):
+                audio_chunk = await task
+                if audio_chunk:
+                    yield audio_chunk
+        finally:
+            # Stop synthesis nobody will hear
+            for task in audio_tasks:
+                task.cancel()
+        if req.session_id:
+            await asyncio.to_thread(session_store.append, req.session_id, req.topic, cached["sections"])
+        yield {"type": "done"}
+
     async def event_generator():
         accumulated_text = {
             "Explanation": "",
@@ -54,33 +304,110 @@ async def explain_stream(req: ExplainRequest):
             "Question": "",
             "Feedback": ""
         }
+        # Per-section TTS tasks, emitted in the order the sections finished
+        audio_tasks = []
+        current_section = None
+        completed = True
+        mode = "full"
+
+        def start_audio(section: str):
+            if accumulated_text.get(section):
+                audio_tasks.append(asyncio.create_task(
+                    synthesize_section(section, accumulated_text[section], AUDIO_PROGRESSIVE)
+                ))
         
-        async for chunk in stream_explain_graph(req.topic, req.age, req.context):
-            yield f"data: {json.dumps(chunk)}\n\n"
+        # Concurrent identical requests subscribe to one shared generation
+        context_hash = hashlib.sha256(req.context.encode("utf-8")).hexdigest()
+        flight_key = f"{cache_key(req.topic, req.age)}|{req.mode}|{context_hash}"
+        source = coalesce(stream_fanout.subscribe(
+            flight_key,
+            lambda: stream_explain_graph(req.topic, req.age, req.context)
+        ))
+        # A newer request from the same session stops this one
+        stop = stream_preemption.claim(req.session_id) if req.session_id else None
+        if stop is not None:
+            source = until_set(source, stop)
+
+        try:
+            try:
+                async for chunk in source:
+                    yield chunk
+                    
+                    # Accumulate text for audio generation
+                    if chunk.get("type") == "intent":
+                        mode = chunk.get("mode", mode)
+                    elif chunk.get("type") == "section":
+                        # The previous section is complete, synthesize it while the next one streams
+                        if current_section:
+                            start_audio(current_section)
+                        current_section = chunk.get("section")
+                    elif chunk.get("type") == "content":
+                        section = chunk.get("section", "")
+                        text = chunk.get("text", "")
+                        if section in accumulated_text:
+                            accumulated_text[section] += text
+                    elif chunk.get("type") == "update":
+                        section = chunk.get("section", "")
+                        if section in accumulated_text:
+                            accumulated_text[section] = chunk.get("text", "")
+                            start_audio(section)
+
+                    # Send audio for sections whose synthesis has already finished
+                    while audio_tasks and audio_tasks[0].done():
+                        audio_chunk = audio_tasks.pop(0).result()
+                        if audio_chunk:
+                            yield audio_chunk
+            except llm_client.OverloadedError as e:
+                # A later stage could not get an LLM slot, finish with what was streamed
+                completed = False
+                yield {"type": "error", "message": str(e)}
+
+            if stop is not None and stop.is_set():
+                # Superseded: leaving the source has cancelled the generation, skip the audio too
+                metrics.streams_cancelled.inc("superseded")
+                yield {"type": "cancelled", "reason": "superseded"}
+                yield {"type": "done"}
+                return
+
+            if current_section:
+                start_audio(current_section)
+
+            # Wait for the remaining audio after all content is streamed
+            for task in audio_tasks:
+                audio_chunk = await task
+                if audio_chunk:
+                    yield audio_chunk
+
+            if key and completed and mode == "full":
+                # Cached the same way as /explain, so both endpoints replay identical answers
+                sections = clean_sections(
+                    accumulated_text["Explanation"], accumulated_text["Example"], accumulated_text["Question"]
+                )
+                remember_explanation(key, {"sections": sections})
+            if req.session_id and completed:
+                await asyncio.to_thread(session_store.append, req.session_id, req.topic, accumulated_text)
             
-            # Accumulate text for audio generation
-            if chunk.get("type") == "content":
-                section = chunk.get("section", "")
-                text = chunk.get("text", "")
-                if section in accumulated_text:
-                    accumulated_text[section] += text
-        
-        # Generate audio after all content is streamed
-        sections_text = "\n\n".join([f"{label}: {text}" for label, text in accumulated_text.items() if text])
-        audio_path = text_to_speech(sections_text)
-        
-        # Send final audio URL
-        audio_chunk = {
-            "type": "audio",
-            "url": f"/audio/{os.path.basename(audio_path)}"
-        }
-        yield f"data: {json.dumps(audio_chunk)}\n\n"
-        
-        # Send completion signal
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            # Send completion signal
+            yield {"type": "done"}
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected and did not resume within STREAM_RESUME_GRACE
+            metrics.streams_cancelled.inc("disconnect")
+            raise
+        finally:
+            # Stop synthesis nobody will hear; the fanout cancels a generation nobody is reading
+            for task in audio_tasks:
+                task.cancel()
+            if stop is not None:
+                stream_preemption.release(req.session_id, stop)
     
+    # Generation runs in the background so it survives a dropped connection
+    return event_stream_response(resumable_streams.start(replay_generator() if cached else event_generator()))
+
+
+def event_stream_response(frames) -> StreamingResponse:
+    """Wrap SSE frames in a streaming response"""
     return StreamingResponse(
-        event_generator(),
+        frames,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -90,6 +417,65 @@ async def explain_stream(req: ExplainRequest):
     )
 
 
+@router.post("/sessions")
+def create_session():
+    """Start a server-side conversation; pass the id as session_id instead of context"""
+    return {"session_id": session_store.create()}
+
+
+@router.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """Get the stored history of a session"""
+    return {"session_id": session_id, "history": session_store.history(session_id)}
+
+
+@router.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """Forget a session's history"""
+    session_store.delete(session_id)
+    return {"deleted": session_id}
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Get explanation cache and near-duplicate topic hit/miss counters"""
+    return {**explain_cache.stats(), "topic_match": topic_index.stats()}
+
+
+@router.get("/llm/stats")
+def llm_stats():
+    """Get LLM pool load, per-backend health and request coalescing counters"""
+    return {
+        **llm_client.pool.stats(),
+        "coalescing": {
+            "explain": explain_flight.stats(),
+            "explain_stream": stream_fanout.stats(),
+            "quiz": quiz_flight.stats(),
+            "tts": tts_flight.stats()
+        },
+        "load_policy": load_policy.stats(),
+        "preemption": stream_preemption.stats(),
+        "resumable": resumable_streams.stats()
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Export stage latency, token and error metrics in Prometheus text format"""
+    pool = llm_client.pool.stats()
+    cache = explain_cache.stats()
+    extra = (
+        metrics.gauge_lines("eli10_llm_active", "LLM generations in flight", pool["active"])
+        + metrics.gauge_lines("eli10_llm_waiting", "Requests queued for an LLM slot", pool["waiting"])
+        + metrics.gauge_lines("eli10_llm_rejected_total", "Requests rejected as overloaded", pool["rejected"], "counter")
+        + metrics.gauge_lines("eli10_llm_healthy_backends", "LLM backends in rotation", pool["healthy_backends"])
+        + metrics.gauge_lines("eli10_degraded_mode", "1 while explanations use the degraded pipeline", int(load_policy.stats()["mode"] == "degraded"))
+        + metrics.gauge_lines("eli10_explain_cache_hits_total", "Explanation cache hits", cache["hits"], "counter")
+        + metrics.gauge_lines("eli10_explain_cache_misses_total", "Explanation cache misses", cache["misses"], "counter")
+    )
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+
 @router.get("/topics")
 def topics():
     """Get all available topic packs"""
@@ -111,31 +497,22 @@ async def audio_options(file_name: str):
 
 
 @router.get("/audio/{file_name}")
-def get_audio(file_name: str):
-    """Serve audio files"""
-    full_path = os.path.join(AUDIO_DIR, file_name)
-    print(f"Full audio path: {full_path}")
-    print(f"File exists: {os.path.exists(full_path)}")
-    
-    if not os.path.exists(full_path):
-        return {"error": "File not found", "path": full_path}
-    
-    # Determine media type based on file extension
-    media_type = "audio/mpeg" if file_name.endswith(".mp3") else "audio/wav"
-    
-    return FileResponse(
-        full_path, 
-        media_type=media_type,
-        headers={
-            "Accept-Ranges": "bytes",
-            "Cache-Control": "no-cache",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Expose-Headers": "*"
-        }
-    )
-    
+def get_audio(file_name: str, request: Request):
+    """Serve audio files with HTTP caching, byte ranges and streaming of in-progress synthesis"""
+    return serve_audio(request, file_name)
+
+
+def clean_sections(explanation: str, example: str, question: str) -> dict:
+    """Build the display sections of an answer, with safety/meta notes removed from the explanation"""
+    formatted = {}
+    extract_useful_content(explanation, formatted)
+    return {
+        "Explanation": formatted.get("Explanation", ""),
+        "Example": formatted.get("Example", "") or example,
+        "Question": question
+    }
+
+
 def extract_useful_content(raw_text: str, display_sections: dict) -> None:
     """Extract and clean content, populating the display_sections dictionary"""
     # Clean the raw text (remove safety/meta notes)
@@ -172,100 +549,168 @@ def extract_useful_content(raw_text: str, display_sections: dict) -> None:
 
 
 @router.post("/quiz/generate")
-def generate_quiz(req: QuizRequest):
-    """Generate quiz questions for a topic"""
-    difficulty_map = {
-        "easy": "simple, straightforward questions",
-        "medium": "moderate difficulty with some critical thinking",
-        "hard": "challenging questions requiring deep understanding"
-    }
-    
-    prompt = f"""
-Generate {req.num_questions} multiple-choice quiz questions about "{req.topic}" for someone who is {req.age} years old.
-
-Difficulty: {difficulty_map[req.difficulty]}
-
-For each question, provide:
-1. The question text
-2. Four answer options (A, B, C, D)
-3. The correct answer (letter only)
-4. A brief explanation
-
-Format as JSON array:
-[
-  {{
-    "question": "Question text here?",
-    "options": {{
-      "A": "Option A text",
-      "B": "Option B text",
-      "C": "Option C text",
-      "D": "Option D text"
-    }},
-    "correct": "A",
-    "explanation": "Brief explanation of the correct answer"
-  }}
-]
-
-Make questions age-appropriate for {req.age} years old.
-"""
+async def generate_quiz(req: QuizRequest):
+    """Generate quiz questions for a topic, reusing banked questions where possible"""
+    banked = await asyncio.to_thread(
+        question_bank.sample, req.topic, req.age, req.difficulty, req.num_questions, req.user_id
+    )
+    if len(banked) < req.num_questions and not req.user_id:
+        key = quiz_key(req.topic, req.age, req.num_questions, req.difficulty)
+        pregenerated = await asyncio.to_thread(pack_store.get, "quiz", key)
+        if pregenerated:
+            return pregenerated
+
+    question_ids = [question_id for question_id, _ in banked]
+    questions = [question for _, question in banked]
+
+    # Only generate the shortfall
+    shortfall = req.num_questions - len(questions)
+    if shortfall > 0:
+        shortfall_req = req.model_copy(update={"num_questions": shortfall})
+        result = await create_quiz(shortfall_req, quiz_key(req.topic, req.age, shortfall, req.difficulty))
+        if "error" in result and not questions:
+            return result
+
+        banked_texts = {normalize_topic(q["question"]) for q in questions}
+        for question_id, question in zip(result.get("question_ids", []), result.get("questions", [])):
+            if normalize_topic(question["question"]) not in banked_texts:
+                question_ids.append(question_id)
+                questions.append(question)
+
+    if req.user_id:
+        await asyncio.to_thread(question_bank.mark_seen, req.user_id, question_ids)
+
+    return {"questions": questions, "topic": req.topic}
+
+
+async def create_quiz(req: QuizRequest, key: str) -> dict:
+    """Ask the LLM for a new quiz and keep every question that parses and validates"""
+    prompt = quiz_prompt(req.topic, req.age, req.num_questions, req.difficulty)
+    response = await quiz_flight.do(key, lambda: llm_client.ainvoke(prompt, stage="quiz_generate"))
     
-    response = llm.invoke(prompt)
+    questions = parse_questions(response)
+    if not questions:
+        return {"error": "Failed to parse quiz: no valid questions found", "raw_response": response}
     
-    # Extract JSON from response
-    import json
-    try:
-        # Try to find JSON in the response
-        json_match = re.search(r'\[.*\]', response, re.DOTALL)
-        if json_match:
-            questions = json.loads(json_match.group(0))
-        else:
-            questions = json.loads(response)
-        
-        return {"questions": questions, "topic": req.topic}
-    except Exception as e:
-        return {"error": f"Failed to parse quiz: {str(e)}", "raw_response": response}
+    question_ids = await asyncio.to_thread(question_bank.add, req.topic, req.age, req.difficulty, questions)
+    return {"questions": questions, "topic": req.topic, "question_ids": question_ids}
+
+
+@router.post("/quiz/generate/stream")
+async def generate_quiz_stream(req: QuizRequest):
+    """Stream quiz questions one by one as soon as each is generated and validated"""
+    llm_client.pool.check_capacity()
+
+    async def event_generator():
+        questions = []
+        try:
+            async for event in stream_quiz(req.topic, req.age, req.num_questions, req.difficulty):
+                if event["type"] == "question":
+                    questions.append(event["question"])
+                yield sse_frame(event)
+        except llm_client.OverloadedError as e:
+            yield sse_frame({"type": "error", "message": str(e)})
+
+        question_ids = await asyncio.to_thread(question_bank.add, req.topic, req.age, req.difficulty, questions)
+        if req.user_id:
+            await asyncio.to_thread(question_bank.mark_seen, req.user_id, question_ids)
+        yield sse_frame({"type": "done", "topic": req.topic})
+
+    return event_stream_response(event_generator())
 
 
 @router.post("/quiz/evaluate")
-def evaluate_quiz_answer(req: QuizAnswerRequest):
+async def evaluate_quiz_answer(req: QuizAnswerRequest):
     """Evaluate a user's answer to a quiz question"""
+    # Correctness of a multiple-choice letter or option text never needs the LLM
+    is_correct = is_correct_answer(req.user_answer, req.correct_answer, req.options)
+    if is_correct is None:
+        is_correct = await judge_answer(req.question, req.correct_answer, req.user_answer, req.options)
+    result = {
+        "is_correct": is_correct,
+        "feedback": feedback_message(is_correct, req.age, req.correct_answer),
+        "explanation": req.explanation
+    }
+    if not req.llm_feedback:
+        return result
+
     prompt = f"""
-Evaluate this student's quiz answer:
+Write feedback on this student's quiz answer:
 
 Question: {req.question}
 Correct Answer: {req.correct_answer}
 Student's Answer: {req.user_answer}
 Student's Age: {req.age}
+The answer is {"correct" if is_correct else "incorrect"}.
 
 Provide:
-1. Is the answer correct? (yes/no)
-2. Encouraging feedback appropriate for age {req.age}
-3. Brief explanation if incorrect
+1. Encouraging feedback appropriate for age {req.age}
+2. Brief explanation if incorrect
 
 Format as JSON:
 {{
-  "is_correct": true/false,
   "feedback": "Feedback message here",
   "explanation": "Explanation if needed"
 }}
 """
     
-    response = llm.invoke(prompt)
+    response = await llm_client.ainvoke(prompt, stage="quiz_feedback")
     
     try:
         # Try to find JSON in the response
         json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group(0))
-        else:
-            result = json.loads(response)
-        
-        return result
+        worded = json.loads(json_match.group(0) if json_match else response)
+        result["feedback"] = worded.get("feedback") or result["feedback"]
+        result["explanation"] = worded.get("explanation") or result["explanation"]
     except Exception as e:
-        # Fallback: simple text comparison
-        is_correct = req.user_answer.strip().upper() == req.correct_answer.strip().upper()
-        return {
+        # Fallback: keep the templated feedback
+        print(f"Error parsing quiz feedback: {e}")
+    
+    return result
+
+
+@router.post("/quiz/evaluate/batch")
+async def evaluate_quiz_batch(req: QuizSubmission):
+    """Score a whole submitted quiz with at most one LLM call, for free-text answers and the summary"""
+    verdicts = [is_correct_answer(a.user_answer, a.correct_answer, a.options) for a in req.answers]
+    undecided = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    llm_summary = None
+    if undecided:
+        # Every free-text answer, and the summary if asked for, share one LLM call
+        prompt = judge_prompt(req.topic, req.age, req.answers, undecided, req.llm_summary)
+        try:
+            judged, llm_summary = parse_judgement(await llm_client.ainvoke(prompt, stage="quiz_judge"), undecided)
+        except Exception as e:
+            # Keep the local scores; the free-text answers stay unjudged
+            print(f"Error judging quiz answers: {e}")
+            judged = {}
+        for i in undecided:
+            verdicts[i] = judged.get(i)
+
+    results = []
+    for answer, is_correct in zip(req.answers, verdicts):
+        results.append({
+            "question": answer.question,
+            "user_answer": answer.user_answer,
+            "correct_answer": answer.correct_answer,
             "is_correct": is_correct,
-            "feedback": "Great job!" if is_correct else "Not quite right, but good try!",
-            "explanation": ""
-        }
+            "feedback": feedback_message(is_correct, req.age, answer.correct_answer),
+            "explanation": answer.explanation
+        })
+
+    score = sum(1 for r in results if r["is_correct"])
+    summary = llm_summary or summary_message(score, len(results), req.age)
+    if req.llm_summary and results and not undecided:
+        try:
+            summary = (await llm_client.ainvoke(summary_prompt(req.topic, req.age, results), stage="quiz_summary")).strip() or summary
+        except Exception as e:
+            # Fallback: keep the templated summary
+            print(f"Error summarizing quiz: {e}")
+
+    return {
+        "topic": req.topic,
+        "score": score,
+        "total": len(results),
+        "results": results,
+        "summary": summary
+    }
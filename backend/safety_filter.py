@@ -0,0 +1,93 @@
+"""
+Local safety and readability checks, used instead of the LLM safety pass in degraded mode
+"""
+import re
+
+# Blocked words per rule of SAFETY_PROMPT with their inflections, as regex fragments; a sentence
+# containing any of them is dropped. Suffixes are listed rather than matched with \w* so that
+# "stab" does not catch "stable". Words with an everyday science meaning ("white blood cells",
+# "kill germs", "the naked eye", "rubbing alcohol", "a shooting star", "volcanic bombs") are only
+# blocked inside violent phrases
+VICTIMS = r"(?:people|a person|someone|somebody|anyone|him|her|them|you|each other|others)"
+BLOCKED_TERMS = {
+    "violence": (
+        rf"(?:kill(?:s|ed|ing)?|shoot(?:s|ing)?|shot|stab(?:s|bed|bing)?) {VICTIMS}", r"shot dead",
+        r"killings?", r"murder(?:s|ed|ing|er|ers|ous)?", r"bloodshed", r"bloody", r"gor(?:e|y)",
+        r"stabbings?", r"shootings? (?:at|of)", r"gun(?:man|men|fire|shots?)", r"weapon(?:s|ry)?",
+        r"bomb(?:ing|ings|ed|er|ers)", r"tortur(?:e|es|ed|ing)", r"behead(?:s|ed|ing)?", r"massacre(?:s|d)?"
+    ),
+    "adult": (
+        r"sex(?:y|ual|ually)", r"porn(?:ography|ographic)?", r"nude", r"drunk(?:en)?", r"alcoholic drinks?",
+        r"cocaine", r"heroin", r"cigarettes?", r"gambl(?:e|es|ed|ing)"
+    ),
+    "fear": (
+        r"terrif(?:ying|ied)", r"horrif(?:ying|ied)", r"horrible death", r"nightmares?", r"you will die",
+        r"you could die", r"die horribly", r"doomed", r"scream(?:s|ed|ing)? in pain"
+    )
+}
+BLOCKED_PATTERNS = {
+    category: re.compile(r"\b(?:" + "|".join(terms) + r")\b", re.IGNORECASE)
+    for category, terms in BLOCKED_TERMS.items()
+}
+# Lead-ins the stage prompts ask the model to leave out ("Here's a rewritten version:")
+METADATA_PATTERN = re.compile(
+    r"^\s*(?:here'?s|here is)\s+(?:a|an|the|my|one)\b[^:\n]{0,60}:\s*", re.IGNORECASE | re.MULTILINE
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_syllables(word: str) -> int:
+    """Rough English syllable count: vowel groups, minus a silent final e"""
+    word = word.lower()
+    groups = len(re.findall(r"[aeiouy]+", word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and groups > 1:
+        groups -= 1
+    return max(groups, 1)
+
+
+def reading_grade(text: str) -> float:
+    """Flesch-Kincaid grade level of text"""
+    sentences = [s for s in SENTENCE_SPLIT.split(text.strip()) if s]
+    words = re.findall(r"[A-Za-z']+", text)
+    if not sentences or not words:
+        return 0.0
+    syllables = sum(count_syllables(w) for w in words)
+    return 0.39 * len(words) / len(sentences) + 11.8 * syllables / len(words) - 15.59
+
+
+def max_grade(age: int) -> float:
+    """Highest reading grade still comfortable at an age (school grade plus one)"""
+    return max(age - 5, 1)
+
+
+def check_text(text: str, age: int) -> dict:
+    """
+    Apply the safety rules locally
+
+    Metadata lead-ins are stripped and sentences with blocked terms are removed. Readability is
+    only measured, since a local rule cannot simplify text the way the LLM pass would.
+
+    Returns:
+        dict: "text" (the filtered text), "flagged" (categories of removed sentences),
+        "grade" (reading grade of the result) and "too_hard" (grade above the age's level)
+    """
+    flagged = set()
+    paragraphs = []
+    for paragraph in METADATA_PATTERN.sub("", text).split("\n"):
+        kept = []
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            hits = {category for category, pattern in BLOCKED_PATTERNS.items() if pattern.search(sentence)}
+            if hits:
+                flagged |= hits
+            else:
+                kept.append(sentence)
+        paragraphs.append(" ".join(kept))
+
+    filtered = re.sub(r"\n\s*\n", "\n\n", "\n".join(paragraphs)).strip()
+    grade = reading_grade(filtered)
+    return {
+        "text": filtered,
+        "flagged": sorted(flagged),
+        "grade": round(grade, 1),
+        "too_hard": grade > max_grade(age)
+    }
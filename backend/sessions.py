@@ -0,0 +1,108 @@
+"""
+Server-side conversation sessions, so clients send a session id instead of the whole history
+"""
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import SESSION_STORE_PATH, SESSION_CACHE_SIZE
+
+REPLY_SECTIONS = ("Explanation", "Example", "Question", "Feedback")
+
+
+def format_reply(sections: dict) -> str:
+    """Format an assistant reply the way the frontend builds conversation history"""
+    return "\n".join(f"{label}: {sections[label]}" for label in REPLY_SECTIONS if sections.get(label))
+
+
+class SessionStore:
+    """
+    Conversation history per session, in an in-memory LRU backed by SQLite
+
+    Every entry (a user message or an assistant reply) is one row. The cache remembers the row ids
+    it has seen per session and only reads newer rows, so sessions stay consistent when several
+    workers append to the same database.
+    """
+
+    def __init__(self, path: str, max_size: int = SESSION_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # WAL plus a busy timeout lets several uvicorn workers share the file
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, text TEXT NOT NULL, "
+                "created REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id);"
+            )
+            self._conn.commit()
+
+    def create(self) -> str:
+        """Issue a new, unguessable session id"""
+        return uuid.uuid4().hex
+
+    def history(self, session_id: str) -> list:
+        """Return every entry of a session in order, reading only rows the cache has not seen"""
+        with self._lock:
+            first_id, last_id, entries = self._cache.get(session_id, (0, 0, []))
+            # Re-reading the first cached row detects a session deleted by another worker
+            rows = self._conn.execute(
+                "SELECT id, text FROM turns WHERE session_id = ? AND (id = ? OR id > ?) ORDER BY id",
+                (session_id, first_id, last_id)
+            ).fetchall()
+            if entries and rows and rows[0][0] == first_id:
+                rows = rows[1:]
+            elif entries:
+                first_id, entries = 0, []
+                rows = self._conn.execute(
+                    "SELECT id, text FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+                ).fetchall()
+
+            if rows:
+                first_id = first_id or rows[0][0]
+                last_id, entries = rows[-1][0], entries + [text for _, text in rows]
+            if entries:
+                self._store(session_id, first_id, last_id, entries)
+            else:
+                self._cache.pop(session_id, None)
+            return list(entries)
+
+    def context(self, session_id: str) -> str:
+        """Return the session history formatted as ExplainRequest.context"""
+        return "\n\n".join(self.history(session_id))
+
+    def append(self, session_id: str, topic: str, sections: dict) -> None:
+        """Record one exchange: the user's input and the assistant's reply"""
+        entries = [f"User: {topic}"]
+        reply = format_reply(sections)
+        if reply:
+            entries.append(reply)
+
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO turns (session_id, text, created) VALUES (?, ?, ?)",
+                [(session_id, text, now) for text in entries]
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+            self._cache.pop(session_id, None)
+
+    def _store(self, session_id: str, first_id: int, last_id: int, entries: list) -> None:
+        self._cache[session_id] = (first_id, last_id, entries)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+# Initialize the store
+session_store = SessionStore(SESSION_STORE_PATH)
@@ -0,0 +1,165 @@
+"""
+Single-flight coalescing of identical in-flight requests
+"""
+import asyncio
+
+
+class SingleFlight:
+    """Share one running call between all concurrent callers with the same key"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self.cancelled = 0
+        self._calls = {}
+        self._waiters = {}
+
+    async def do(self, key: str, fn, cancel_abandoned: bool = False):
+        """
+        Await fn() once per key, no matter how many callers ask for it concurrently
+
+        Args:
+            key: Identity of the call; callers with equal keys share the result
+            fn: Zero-argument callable returning an awaitable
+            cancel_abandoned: Cancel the call once every caller waiting on it has been cancelled
+
+        Returns:
+            The result of fn(), or raises its exception in every caller
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shield so one caller disconnecting does not cancel the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if cancel_abandoned and self._waiters[task] == 1 and not task.done():
+                # Nobody is left to use the result
+                task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "coalesced": self.coalesced, "cancelled": self.cancelled}
+
+
+class Broadcast:
+    """
+    Runs one event stream and keeps every emitted event for subscribers to replay
+
+    Once the last subscriber leaves an unfinished stream, it is cancelled after grace seconds
+    unless someone subscribes again in the meantime.
+    """
+
+    def __init__(self, source, grace: float = 0):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.grace = grace
+        self._abandon_timer = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._run(source))
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _run(self, source) -> None:
+        try:
+            async for event in source:
+                self.events.append(event)
+                await self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            await self._notify()
+
+    def _cancel_if_abandoned(self) -> None:
+        self._abandon_timer = None
+        if not self.subscribers and not self.done:
+            # Every client left: stop generating (this aborts the in-flight LLM request)
+            self.cancelled = True
+            self.task.cancel()
+
+    async def subscribe(self, start: int = 0):
+        """Yield the already-emitted events from index start, then live events until the stream ends"""
+        self.subscribers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        position = start
+        try:
+            while True:
+                while position < len(self.events):
+                    yield self.events[position]
+                    position += 1
+
+                if self.done:
+                    if self.error:
+                        raise self.error
+                    return
+
+                async with self._changed:
+                    await self._changed.wait_for(lambda: position < len(self.events) or self.done)
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                if self.grace:
+                    self._abandon_timer = asyncio.get_running_loop().call_later(self.grace, self._cancel_if_abandoned)
+                else:
+                    self._cancel_if_abandoned()
+
+
+class StreamFanout:
+    """Fan out one underlying event stream to every concurrent subscriber with the same key"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self.cancelled = 0
+        self._broadcasts = {}
+
+    def subscribe(self, key: str, source_factory):
+        """
+        Subscribe to the stream for key, starting it with source_factory() if none is running
+
+        Args:
+            key: Identity of the stream; subscribers with equal keys share it
+            source_factory: Zero-argument callable returning an async iterator of events
+
+        Returns:
+            Async iterator over the shared events, starting from the first one
+        """
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None or broadcast.cancelled:
+            # A cancelled stream is incomplete, so a new subscriber starts a fresh one
+            broadcast = Broadcast(source_factory())
+            self._broadcasts[key] = broadcast
+            broadcast.task.add_done_callback(lambda t: self._forget(key, broadcast))
+        else:
+            self.coalesced += 1
+        return broadcast.subscribe()
+
+    def _forget(self, key: str, broadcast: Broadcast) -> None:
+        if broadcast.cancelled:
+            self.cancelled += 1
+        if self._broadcasts.get(key) is broadcast:
+            del self._broadcasts[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._broadcasts), "coalesced": self.coalesced, "cancelled": self.cancelled}
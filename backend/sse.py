@@ -0,0 +1,100 @@
+"""
+Server-Sent Events framing, with token chunks coalesced into fewer frames
+"""
+import json
+import asyncio
+from config import SSE_FLUSH_INTERVAL, SSE_FLUSH_BYTES, SSE_COMPACT
+
+
+def sse_frame(event: dict, event_id: str = None, compact: bool = SSE_COMPACT) -> str:
+    """Encode one event as an SSE data frame, with an id line if event_id is given"""
+    prefix = f"id: {event_id}\n" if event_id else ""
+    if compact:
+        # No padding and raw UTF-8 instead of \u escapes; any JSON parser reads it the same
+        return f"{prefix}data: {json.dumps(event, separators=(',', ':'), ensure_ascii=False)}\n\n"
+    return f"{prefix}data: {json.dumps(event)}\n\n"
+
+
+async def coalesce(source, interval: float = SSE_FLUSH_INTERVAL, max_bytes: int = SSE_FLUSH_BYTES):
+    """
+    Merge consecutive content events of one section into fewer, larger events
+
+    The first chunk of each section is sent immediately. Later text is buffered and flushed when
+    interval seconds have passed since its first chunk, when it reaches max_bytes, or before any
+    other event (section, update, audio, done, ...), so event order and meaning are unchanged.
+    An interval of 0 passes every event straight through.
+
+    Args:
+        source: Async iterator of stream events
+        interval: Longest time a token may wait in the buffer
+        max_bytes: Buffered text size (UTF-8) that triggers a flush
+    """
+    if interval <= 0:
+        async for event in source:
+            yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    events = source.__aiter__()
+    pending = None  # Task fetching the next event from source
+    buffered = None  # Content event being extended
+    section = None  # Section of the last content event
+    size = 0
+    deadline = 0.0
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            timeout = None if buffered is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Window elapsed with no new chunk
+                yield buffered
+                buffered = None
+                continue
+
+            fetched, pending = pending, None
+            try:
+                event = fetched.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # Deliver what was already generated before the error reaches the caller
+                if buffered is not None:
+                    yield buffered
+                raise
+
+            if event.get("type") == "content":
+                if event.get("section") != section:
+                    # The first chunk of a section goes out at once, so time to first token is unchanged
+                    if buffered is not None:
+                        yield buffered
+                        buffered = None
+                    section = event.get("section")
+                    yield event
+                    continue
+
+                if buffered is not None:
+                    buffered["text"] += event.get("text", "")
+                else:
+                    buffered = dict(event)
+                    buffered.setdefault("text", "")
+                    size = 0
+                    deadline = loop.time() + interval
+                size += len(event.get("text", "").encode("utf-8"))
+                if size >= max_bytes:
+                    yield buffered
+                    buffered = None
+                continue
+
+            if buffered is not None:
+                yield buffered
+                buffered = None
+            yield event
+
+        if buffered is not None:
+            yield buffered
+    finally:
+        if pending is not None:
+            pending.cancel()
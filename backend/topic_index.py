@@ -0,0 +1,294 @@
+"""
+Near-duplicate topic index, so rephrased or misspelled topics reuse an answer already generated
+"""
+import re
+import zlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from cache import explain_cache, parse_cache_key, age_band, normalize_topic
+from pack_store import pack_store
+from topic_packs import TOPIC_PACKS
+from config import (
+    TOPIC_MATCH, TOPIC_MATCH_THRESHOLD, TOPIC_WORD_THRESHOLD, TOPIC_TYPO_THRESHOLD, TOPIC_KNOWN_WORD_THRESHOLD,
+    TOPIC_INDEX_MAX
+)
+
+DIMS = 512  # Hashed character n-gram buckets per vector
+NGRAM_SIZES = (2, 3)
+CANDIDATES = 5  # Best whole-topic matches checked word by word
+
+# Phrasing around the topic itself, stripped in order: "can you explain what is X" -> "X"
+TOPIC_PATTERNS = (
+    (re.compile(r"^(?:can you|could you|please) "), ""),
+    (re.compile(r"^(?:explain|describe|define|tell me about|teach me about|teach me)(?: about)? "), ""),
+    (re.compile(r"^(?:what|who) (?:is|are|was|were) "), ""),
+    (re.compile(r"^how (?:does|do|did) (.+?)(?: work| works| happen| happens| form)$"), r"\1"),
+    (re.compile(r" (?:please|for me|to me|explained)$"), "")
+)
+FILLER_WORDS = {"a", "an", "the", "of", "is", "are", "do", "does", "how", "why", "what"}
+# Letter -> (x, y) on a QWERTY keyboard, rows offset by half a key
+KEY_POSITIONS = {
+    letter: (column + row / 2, row)
+    for row, letters in enumerate(("qwertyuiop", "asdfghjkl", "zxcvbnm"))
+    for column, letter in enumerate(letters)
+}
+
+
+def singular(word: str) -> str:
+    """Strip a regular plural ending, so plurals match exactly instead of by similarity"""
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ses", "xes", "zes", "ches", "shes", "oes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def canonical_topic(topic: str) -> str:
+    """Reduce a normalized topic to its singular content words"""
+    for pattern, replacement in TOPIC_PATTERNS:
+        topic = pattern.sub(replacement, topic)
+    words = [singular(w) for w in topic.split() if w not in FILLER_WORDS]
+    return " ".join(words) or topic
+
+
+def _adjacent_keys(a: str, b: str) -> bool:
+    if a not in KEY_POSITIONS or b not in KEY_POSITIONS:
+        return False
+    (ax, ay), (bx, by) = KEY_POSITIONS[a], KEY_POSITIONS[b]
+    return abs(ax - bx) <= 1 and abs(ay - by) <= 1
+
+
+def is_typo(word: str, target: str) -> bool:
+    """
+    Whether word is target with one typing slip: a letter added, dropped, swapped with its
+    neighbour or replaced by an adjacent key
+
+    Slips in the first two letters are not counted: they are rare in typos, but common between
+    different real words ("factions" and "fractions", "motions" and "emotions").
+    """
+    if word == target or abs(len(word) - len(target)) > 1:
+        return False
+    first = next((i for i, (a, b) in enumerate(zip(word, target)) if a != b), min(len(word), len(target)))
+    if first < 2:
+        return False
+    if len(word) != len(target):
+        longer, shorter = (word, target) if len(word) > len(target) else (target, word)
+        return longer[first + 1:] == shorter[first:]
+    if word[first + 1:] == target[first + 1:]:
+        return _adjacent_keys(word[first], target[first])
+    return word[first:first + 2] == target[first + 1:first - 1:-1] and word[first + 2:] == target[first + 2:]
+
+
+def word_vectors(text: str) -> np.ndarray:
+    """One row of hashed character n-gram counts per word"""
+    words = text.split()
+    vectors = np.zeros((len(words), DIMS), dtype=np.float32)
+    for row, word in enumerate(words):
+        padded = f" {word} "
+        buckets = [
+            zlib.crc32(padded[i:i + n].encode("utf-8")) % DIMS
+            for n in NGRAM_SIZES for i in range(len(padded) - n + 1)
+        ]
+        vectors[row] = np.bincount(buckets, minlength=DIMS)
+    return vectors
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+class TopicIndex:
+    """
+    Answered topics per age band as character n-gram vectors, searched by cosine similarity
+
+    An input matches an indexed topic when the whole topics are at least threshold similar and
+    every word on either side has a counterpart. Words are compared by how likely the input word
+    is a misspelling:
+
+    - A word of the vocabulary (words of TOPIC_PACKS and of every indexed topic) is a real word,
+      so it needs known_word_threshold to count as the same as another word.
+    - Any other word needs typo_threshold if it is one typing slip away ("gravitiy"), or
+      word_threshold otherwise ("photosynthesys").
+
+    Plurals are made singular first, so "volcano" matches "volcanoes". Real words one edit apart
+    ("factions" and "fractions") and topics that differ in one real word ("sky blue" and
+    "sea blue") do not match.
+    """
+
+    def __init__(self, threshold: float = TOPIC_MATCH_THRESHOLD, word_threshold: float = TOPIC_WORD_THRESHOLD,
+                 typo_threshold: float = TOPIC_TYPO_THRESHOLD, known_word_threshold: float = TOPIC_KNOWN_WORD_THRESHOLD,
+                 max_topics: int = TOPIC_INDEX_MAX):
+        self.threshold = threshold
+        self.word_threshold = word_threshold
+        self.typo_threshold = typo_threshold
+        self.known_word_threshold = known_word_threshold
+        self.max_topics = max_topics
+        self.hits = 0
+        self.misses = 0
+        self._bands = {}  # Age band -> OrderedDict of key -> (canonical topic, unit vector)
+        self._matrices = {}  # Age band -> (keys, stacked vectors), rebuilt after changes
+        self._lock = threading.Lock()
+        self.vocabulary = {
+            word for topics in TOPIC_PACKS.values() for topic in topics
+            for word in canonical_topic(normalize_topic(topic)).split()
+        }
+
+    def add(self, key: str) -> None:
+        """Index the topic of an explanation key; keys of other models or prompt versions are ignored"""
+        parsed = parse_cache_key(key)
+        if parsed is None:
+            return
+        band, topic = parsed
+        canonical = canonical_topic(topic)
+        vector = _unit(word_vectors(canonical).sum(axis=0))
+        with self._lock:
+            self.vocabulary.update(canonical.split())
+            topics = self._bands.setdefault(band, OrderedDict())
+            topics[key] = (canonical, vector)
+            topics.move_to_end(key)
+            while len(topics) > self.max_topics:
+                topics.popitem(last=False)
+            self._matrices.pop(band, None)
+
+    def discard(self, key: str) -> None:
+        """Forget a key whose answer is gone"""
+        parsed = parse_cache_key(key)
+        with self._lock:
+            if parsed and self._bands.get(parsed[0], {}).pop(key, None):
+                self._matrices.pop(parsed[0], None)
+
+    def match(self, topic: str, age: int) -> Optional[str]:
+        """
+        Find an already answered topic that means the same as topic
+
+        Returns:
+            The key of the matching answer, or None to fall back to generation
+        """
+        band = age_band(age)
+        canonical = canonical_topic(normalize_topic(topic))
+        words = _unit(word_vectors(canonical))
+        if not len(words):
+            return None
+        query = _unit(words.sum(axis=0))
+
+        with self._lock:
+            keys, matrix = self._matrix(band)
+            if not keys:
+                self.misses += 1
+                return None
+            scores = matrix @ query
+            above = np.flatnonzero(scores >= self.threshold)
+            best = above[np.argsort(-scores[above])[:CANDIDATES]]
+            candidates = [(keys[i], self._bands[band][keys[i]][0]) for i in best]
+
+        for key, candidate in candidates:
+            if candidate == canonical or self._words_match(canonical, words, candidate):
+                self.hits += 1
+                return key
+        self.misses += 1
+        return None
+
+    def _matrix(self, band: str) -> tuple:
+        if band not in self._matrices:
+            topics = self._bands.get(band, {})
+            keys = list(topics)
+            matrix = np.stack([vector for _, vector in topics.values()]) if keys else np.zeros((0, DIMS), np.float32)
+            self._matrices[band] = (keys, matrix)
+        return self._matrices[band]
+
+    def _word_threshold(self, word: str, other: str) -> float:
+        if word == other:
+            return 0.0
+        if word in self.vocabulary:
+            return self.known_word_threshold
+        return self.typo_threshold if is_typo(word, other) else self.word_threshold
+
+    def _words_match(self, text: str, words: np.ndarray, candidate: str) -> bool:
+        similarity = words @ _unit(word_vectors(candidate)).T
+        thresholds = np.array([[self._word_threshold(w, c) for c in candidate.split()] for w in text.split()])
+        matches = similarity >= thresholds
+        return bool(matches.any(axis=1).all() and matches.any(axis=0).all())
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = sum(len(topics) for topics in self._bands.values())
+        lookups = self.hits + self.misses
+        return {
+            "enabled": TOPIC_MATCH,
+            "topics": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "threshold": self.threshold
+        }
+
+
+# Initialize the index from the answers already stored
+topic_index = TopicIndex()
+if TOPIC_MATCH:
+    for stored_key in pack_store.keys("explain") + explain_cache.keys():
+        topic_index.add(stored_key)
+
+
+# Labelled lookups the matching rules must keep getting right, against an index of REGRESSION_TOPICS;
+# None means a new answer is generated. Run `python topic_index.py` after changing a rule.
+REGRESSION_TOPICS = (
+    "gravity", "fractions", "emotions", "computers", "friendship", "volcanoes", "photosynthesis",
+    "why is the sky blue", "condensation", "planets"
+)
+REGRESSION_CASES = (
+    ("gravitiy", "gravity"),
+    ("what is gravity?", "gravity"),
+    ("how does gravity work", "gravity"),
+    ("gravty", "gravity"),
+    ("volcano", "volcanoes"),
+    ("tell me about volcanos", "volcanoes"),
+    ("photosynthesys", "photosynthesis"),
+    ("why is the sky blu", "why is the sky blue"),
+    ("computres", "computers"),
+    ("how do computers work", "computers"),
+    ("what are fractions", "fractions"),
+    ("emotion", "emotions"),
+    ("factions", None),
+    ("motions", None),
+    ("commuters", None),
+    ("friends", None),
+    ("why is the sea blue", None),
+    ("condemnation", None),
+    ("plants", None),
+    ("gravity waves", None),
+    ("cats", None)
+)
+
+
+def check_regressions() -> list:
+    """Return (input, expected, got) for every labelled lookup the rules now get wrong"""
+    from cache import cache_key
+
+    index = TopicIndex()
+    for topic in REGRESSION_TOPICS:
+        index.add(cache_key(topic, 9))
+    failures = []
+    for topic, expected in REGRESSION_CASES:
+        key = index.match(topic, 9)
+        got = parse_cache_key(key)[1] if key else None
+        if got != expected:
+            failures.append((topic, expected, got))
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+
+    failures = check_regressions()
+    for topic, expected, got in failures:
+        print(f"{topic!r}: expected {expected or 'no match'}, got {got or 'no match'}")
+    print(f"{len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} topic match cases pass")
+    sys.exit(1 if failures else 0)
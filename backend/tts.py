@@ -2,35 +2,205 @@
 Text-to-speech functionality using Google TTS
 """
 import os
+import re
+import time
 import uuid
+import asyncio
+import shutil
+import hashlib
+import threading
+from typing import Optional
 from gtts import gTTS
-from config import AUDIO_DIR
+import metrics
+from config import (
+    AUDIO_DIR,
+    PACK_AUDIO_DIR,
+    AUDIO_MAX_BYTES,
+    AUDIO_MAX_AGE,
+    AUDIO_SWEEP_INTERVAL,
+    TTS_BACKEND,
+    FAKE_TTS_LATENCY
+)
 
+# Content-addressed audio files are named by the SHA-256 of their inputs
+AUDIO_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.mp3$")
 
-def text_to_speech(text: str) -> str:
+# File name -> temp file currently being written by a synthesis
+_in_progress = {}
+_in_progress_lock = threading.Lock()
+
+
+def audio_file_name(text: str, lang: str = "en", slow: bool = False) -> str:
+    """
+    Build the content-addressed file name for a piece of speech
+
+    Args:
+        text: The text to convert to speech
+        lang: gTTS language code
+        slow: Whether gTTS should speak slowly
+
+    Returns:
+        str: File name derived from a hash of (text, lang, speed)
+    """
+    digest = hashlib.sha256(f"{lang}\0{int(slow)}\0{text}".encode("utf-8")).hexdigest()
+    return f"{digest}.mp3"
+
+
+def is_content_addressed(file_name: str) -> bool:
+    """Check whether an audio file name is a content hash (and so never changes)"""
+    return bool(AUDIO_NAME_PATTERN.match(file_name))
+
+
+def find_audio(file_name: str) -> Optional[str]:
+    """Return the path of an audio file in AUDIO_DIR or PACK_AUDIO_DIR, or None if missing"""
+    file_name = os.path.basename(file_name)
+    for directory in (AUDIO_DIR, PACK_AUDIO_DIR):
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def synthesis_in_progress(file_name: str) -> Optional[str]:
+    """Return the temp file a running synthesis is writing for file_name, or None"""
+    with _in_progress_lock:
+        return _in_progress.get(os.path.basename(file_name))
+
+
+def pin_audio(path: str) -> str:
+    """Copy an audio file into PACK_AUDIO_DIR so the sweeper never evicts it"""
+    os.makedirs(PACK_AUDIO_DIR, exist_ok=True)
+    pinned_path = os.path.join(PACK_AUDIO_DIR, os.path.basename(path))
+    if not os.path.exists(pinned_path):
+        tmp_path = f"{pinned_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, pinned_path)
+    return pinned_path
+
+
+class SynthesisCancelled(Exception):
+    """Raised when a synthesis is aborted because nobody is waiting for the audio any more"""
+
+
+def text_to_speech(text: str, lang: str = "en", slow: bool = False, abort: threading.Event = None) -> str:
     """
-    Convert text to speech and save as MP3
-    
+    Convert text to speech and save as MP3, reusing an existing file for identical input
+
     Args:
         text: The text to convert to speech
-        
+        lang: gTTS language code
+        slow: Whether gTTS should speak slowly
+        abort: Set from another thread to stop the synthesis between gTTS requests
+
     Returns:
         str: Path to the generated audio file
+
+    Raises:
+        SynthesisCancelled: If abort was set before the synthesis finished
     """
     # Create audio directory if it doesn't exist
     os.makedirs(AUDIO_DIR, exist_ok=True)
-    
-    # Generate MP3 file directly using gTTS
-    file_id = uuid.uuid4()
-    mp3_path = os.path.join(AUDIO_DIR, f"{file_id}.mp3")
-    
+
+    file_name = audio_file_name(text, lang, slow)
+    pinned_path = os.path.join(PACK_AUDIO_DIR, file_name)
+    if os.path.exists(pinned_path):
+        return pinned_path
+
+    mp3_path = os.path.join(AUDIO_DIR, file_name)
+
+    if os.path.exists(mp3_path):
+        # Refresh mtime so the sweeper treats the file as recently used
+        os.utime(mp3_path)
+        return mp3_path
+
     print(f"Generating audio at: {mp3_path}")
-    
+
+    # Write to a unique temp file and rename so concurrent requests never see a partial MP3.
+    # The temp file is registered while it grows so /audio can stream it before it is complete.
+    tmp_path = f"{mp3_path}.{uuid.uuid4().hex}.tmp"
+    aborted = False
     try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        tts.save(mp3_path)
-        print(f"MP3 file created: {os.path.exists(mp3_path)}")
+        with metrics.track("tts"), open(tmp_path, "wb") as f:
+            with _in_progress_lock:
+                _in_progress[file_name] = tmp_path
+            chunks = _fake_speech(text) if TTS_BACKEND == "fake" else gTTS(text=text, lang=lang, slow=slow).stream()
+            for chunk in chunks:
+                if abort is not None and abort.is_set():
+                    aborted = True
+                    break
+                f.write(chunk)
+                f.flush()
+        if aborted:
+            raise SynthesisCancelled(mp3_path)
+        os.replace(tmp_path, mp3_path)
         return mp3_path
+    except SynthesisCancelled:
+        metrics.record_cancelled("tts")
+        os.remove(tmp_path)
+        raise
     except Exception as e:
         print(f"Error generating audio: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise e
+    finally:
+        # Only after the rename, so a reader that misses the temp file finds the final one
+        with _in_progress_lock:
+            if _in_progress.get(file_name) == tmp_path:
+                del _in_progress[file_name]
+
+
+def _fake_speech(text: str, parts: int = 4):
+    """Yield placeholder bytes over a fixed delay, standing in for gTTS in benchmarks"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    yield b"ID3"
+    for _ in range(parts):
+        time.sleep(FAKE_TTS_LATENCY / parts)
+        yield digest
+
+
+def sweep_audio_dir(max_bytes: int = AUDIO_MAX_BYTES, max_age: float = AUDIO_MAX_AGE) -> int:
+    """
+    Evict audio files older than max_age, then the least recently used until under max_bytes
+
+    Returns:
+        int: Number of files removed
+    """
+    if not os.path.isdir(AUDIO_DIR):
+        return 0
+
+    now = time.time()
+    files = []
+    for entry in os.scandir(AUDIO_DIR):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    # Oldest first
+    files.sort()
+    total_bytes = sum(size for _, size, _ in files)
+    removed = 0
+
+    for mtime, size, path in files:
+        if now - mtime <= max_age and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+
+    if removed:
+        print(f"Audio sweeper removed {removed} files, {total_bytes} bytes remain")
+    return removed
+
+
+async def audio_sweeper():
+    """Background task that periodically enforces the AUDIO_DIR size and age limits"""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_audio_dir)
+        except Exception as e:
+            print(f"Error sweeping audio directory: {e}")
+        await asyncio.sleep(AUDIO_SWEEP_INTERVAL)
@@ -0,0 +1,152 @@
+"""
+Offline pre-generation of TOPIC_PACKS across age bands
+
+Run as a batch job with `python warmup.py`, or trigger it on a running server with POST /warmup.
+"""
+import json
+import time
+import asyncio
+import argparse
+from fastapi import APIRouter
+from models import ExplainRequest, QuizRequest
+from routes import generate_explanation, create_quiz, synthesize_section
+from topic_packs import TOPIC_PACKS
+from cache import cache_key, quiz_key
+from pack_store import pack_store
+from tts import pin_audio, find_audio
+from config import AGE_BANDS, WARMUP_CONCURRENCY, WARMUP_QUIZ_DIFFICULTIES, WARMUP_QUIZ_QUESTIONS
+
+router = APIRouter()
+
+# Progress of the most recent warm-up run, exposed by GET /warmup
+warmup_status = {"running": False, "report": None}
+_warmup_task = None
+
+
+def band_age(band: tuple) -> int:
+    """Representative age used to generate content for an age band"""
+    low, high = band
+    return (low + high) // 2
+
+
+def plan_items() -> list:
+    """List every (kind, topic, age, difficulty) item the warm-up should produce"""
+    items = []
+    for topics in TOPIC_PACKS.values():
+        for topic in topics:
+            for band in AGE_BANDS:
+                age = band_age(band)
+                items.append(("explain", topic, age, None))
+                for difficulty in WARMUP_QUIZ_DIFFICULTIES:
+                    items.append(("quiz", topic, age, difficulty))
+    return items
+
+
+def item_key(kind: str, topic: str, age: int, difficulty: str) -> str:
+    if kind == "explain":
+        return cache_key(topic, age)
+    return quiz_key(topic, age, WARMUP_QUIZ_QUESTIONS, difficulty)
+
+
+async def _generate_explain(topic: str, age: int, key: str) -> None:
+    # Packs are kept indefinitely, so they always get the full pipeline
+    result = await generate_explanation(ExplainRequest(topic=topic, age=age), key, mode="full")
+
+    # Pin the combined audio for /explain and per-section audio for /explain/stream
+    pin_audio(find_audio(result["audio_url"]))
+    for section, text in result["sections"].items():
+        if text:
+            audio_chunk = await synthesize_section(section, text)
+            if audio_chunk:
+                pin_audio(find_audio(audio_chunk["url"]))
+
+    await asyncio.to_thread(pack_store.put, "explain", key, result)
+
+
+async def _generate_quiz(topic: str, age: int, difficulty: str, key: str) -> None:
+    result = await create_quiz(QuizRequest(
+        topic=topic,
+        age=age,
+        num_questions=WARMUP_QUIZ_QUESTIONS,
+        difficulty=difficulty
+    ), key)
+    if "error" in result:
+        raise ValueError(result["error"])
+    await asyncio.to_thread(pack_store.put, "quiz", key, result)
+
+
+async def run_warmup(concurrency: int = WARMUP_CONCURRENCY, force: bool = False) -> dict:
+    """
+    Generate every pack item not already in the store
+
+    Args:
+        concurrency: Number of items generated in parallel
+        force: Regenerate items that are already stored
+
+    Returns:
+        dict: Report with counts, failures and throughput
+    """
+    items = plan_items()
+    semaphore = asyncio.Semaphore(concurrency)
+    report = {"total": len(items), "generated": 0, "skipped": 0, "failed": 0, "failures": []}
+    start = time.perf_counter()
+
+    async def process(kind: str, topic: str, age: int, difficulty: str) -> None:
+        key = item_key(kind, topic, age, difficulty)
+        if not force and await asyncio.to_thread(pack_store.has, kind, key):
+            # Resume: this item was produced by an earlier run
+            report["skipped"] += 1
+            return
+
+        async with semaphore:
+            try:
+                if kind == "explain":
+                    await _generate_explain(topic, age, key)
+                else:
+                    await _generate_quiz(topic, age, difficulty, key)
+                report["generated"] += 1
+            except Exception as e:
+                report["failed"] += 1
+                report["failures"].append({"kind": kind, "topic": topic, "age": age, "error": str(e)})
+                print(f"Warm-up failed for {kind} '{topic}' age {age}: {e}")
+
+    await asyncio.gather(*(process(*item) for item in items))
+
+    elapsed = time.perf_counter() - start
+    report["elapsed_seconds"] = round(elapsed, 2)
+    report["items_per_second"] = round(report["generated"] / elapsed, 3) if elapsed else 0.0
+    return report
+
+
+async def _run_in_background(concurrency: int, force: bool) -> None:
+    warmup_status["running"] = True
+    try:
+        warmup_status["report"] = await run_warmup(concurrency, force)
+    finally:
+        warmup_status["running"] = False
+
+
+@router.post("/warmup")
+async def start_warmup(concurrency: int = WARMUP_CONCURRENCY, force: bool = False):
+    """Start pre-generating topic packs in the background"""
+    global _warmup_task
+    if warmup_status["running"]:
+        return {"status": "already running"}
+    _warmup_task = asyncio.create_task(_run_in_background(concurrency, force))
+    return {"status": "started", "items": len(plan_items())}
+
+
+@router.get("/warmup")
+def get_warmup():
+    """Get warm-up progress and the last report"""
+    return {**warmup_status, "stored": pack_store.count()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate topic packs for every age band")
+    parser.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY)
+    parser.add_argument("--force", action="store_true", help="Regenerate items already in the store")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_warmup(args.concurrency, args.force))
+    print(json.dumps(report, indent=2))
@@ -11,6 +11,7 @@ import { useChatStorage } from "./hooks/useChatStorage";
 
 // Get chat retention hours from environment variable (default 24 hours)
 const CHAT_RETENTION_HOURS = Number(import.meta.env.VITE_CHAT_RETENTION_HOURS) || 24;
+const MAX_STREAM_RETRIES = 3;
 const CHAT_RETENTION_MS = CHAT_RETENTION_HOURS * 60 * 60 * 1000;
 
 export default function App() {
@@ -291,112 +292,137 @@ export default function App() {
         context: conversationHistory || ""
       };
 
-      const res = await fetch(`${import.meta.env.VITE_API_URL}/explain/stream`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(requestBody)
-      });
+      // After a dropped connection, reconnect and resume from the last event received
+      let lastEventId = null;
+      let finished = false;
+      for (let attempt = 0; !finished; attempt++) {
+        try {
+          const res = await fetch(`${import.meta.env.VITE_API_URL}/explain/stream`, {
+            method: "POST",
+            headers: {
+              "Content-Type": "application/json",
+              ...(lastEventId && { "Last-Event-ID": lastEventId })
+            },
+            body: JSON.stringify(requestBody)
+          });
 
-      const reader = res.body.getReader();
-      const decoder = new TextDecoder();
+          const reader = res.body.getReader();
+          const decoder = new TextDecoder();
+          // Frames can be split across reads, so keep the trailing partial line for the next one
+          let pending = "";
+          let frameId = null;
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split("\n");
+            pending += decoder.decode(value, { stream: true });
+            const lines = pending.split("\n");
+            pending = lines.pop();
 
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            try {
-              const data = JSON.parse(line.slice(6));
+            for (const line of lines) {
+              if (line.startsWith("id: ")) {
+                frameId = line.slice(4);
+              } else if (line.startsWith("data: ")) {
+                try {
+                  const data = JSON.parse(line.slice(6));
 
-              if (data.type === "section") {
-                // Section marker - no action needed
-              } else if (data.type === "content") {
-                const section = data.section;
-                const text = data.text;
-                
-                setChats(prev =>
-                  prev.map(c =>
-                    c.id === chatId
-                      ? {
-                          ...c,
-                          messages: c.messages.map((msg, idx) =>
-                            idx === assistantMsgIndex && msg.streaming
-                              ? {
-                                  ...msg,
-                                  sections: {
-                                    ...msg.sections,
-                                    [section]: (msg.sections[section] || "") + text
-                                  }
-                                }
-                              : msg
-                          )
-                        }
-                      : c
-                  )
-                );
-              } else if (data.type === "update") {
-                const section = data.section;
-                const text = data.text;
-                
-                setChats(prev =>
-                  prev.map(c =>
-                    c.id === chatId
-                      ? {
-                          ...c,
-                          messages: c.messages.map((msg, idx) =>
-                            idx === assistantMsgIndex && msg.streaming
-                              ? {
-                                  ...msg,
-                                  sections: {
-                                    ...msg.sections,
-                                    [section]: text
-                                  }
-                                }
-                              : msg
-                          )
-                        }
-                      : c
-                  )
-                );
-              } else if (data.type === "audio") {
-                setChats(prev =>
-                  prev.map(c =>
-                    c.id === chatId
-                      ? {
-                          ...c,
-                          messages: c.messages.map((msg, idx) =>
-                            idx === assistantMsgIndex && msg.streaming
-                              ? { ...msg, audio_url: data.url }
-                              : msg
-                          )
-                        }
-                      : c
-                  )
-                );
-              } else if (data.type === "done") {
-                setChats(prev =>
-                  prev.map(c =>
-                    c.id === chatId
-                      ? {
-                          ...c,
-                          messages: c.messages.map((msg, idx) =>
-                            idx === assistantMsgIndex && msg.streaming
-                              ? { ...msg, streaming: false }
-                              : msg
-                          )
-                        }
-                      : c
-                  )
-                );
+                  if (data.type === "section") {
+                    // Section marker - no action needed
+                  } else if (data.type === "content") {
+                    const section = data.section;
+                    const text = data.text;
+                    
+                    setChats(prev =>
+                      prev.map(c =>
+                        c.id === chatId
+                          ? {
+                              ...c,
+                              messages: c.messages.map((msg, idx) =>
+                                idx === assistantMsgIndex && msg.streaming
+                                  ? {
+                                      ...msg,
+                                      sections: {
+                                        ...msg.sections,
+                                        [section]: (msg.sections[section] || "") + text
+                                      }
+                                    }
+                                  : msg
+                              )
+                            }
+                          : c
+                      )
+                    );
+                  } else if (data.type === "update") {
+                    const section = data.section;
+                    const text = data.text;
+                    
+                    setChats(prev =>
+                      prev.map(c =>
+                        c.id === chatId
+                          ? {
+                              ...c,
+                              messages: c.messages.map((msg, idx) =>
+                                idx === assistantMsgIndex && msg.streaming
+                                  ? {
+                                      ...msg,
+                                      sections: {
+                                        ...msg.sections,
+                                        [section]: text
+                                      }
+                                    }
+                                  : msg
+                              )
+                            }
+                          : c
+                      )
+                    );
+                  } else if (data.type === "audio") {
+                    setChats(prev =>
+                      prev.map(c =>
+                        c.id === chatId
+                          ? {
+                              ...c,
+                              messages: c.messages.map((msg, idx) =>
+                                idx === assistantMsgIndex && msg.streaming
+                                  ? data.section
+                                    ? { ...msg, audio_urls: { ...msg.audio_urls, [data.section]: data.url } }
+                                    : { ...msg, audio_url: data.url }
+                                  : msg
+                              )
+                            }
+                          : c
+                      )
+                    );
+                  } else if (data.type === "done") {
+                    finished = true;
+                    setChats(prev =>
+                      prev.map(c =>
+                        c.id === chatId
+                          ? {
+                              ...c,
+                              messages: c.messages.map((msg, idx) =>
+                                idx === assistantMsgIndex && msg.streaming
+                                  ? { ...msg, streaming: false }
+                                  : msg
+                              )
+                            }
+                          : c
+                      )
+                    );
+                  }
+                } catch (e) {
+                  console.error("Error parsing SSE data:", e);
+                }
+                // Only count an event as received once its data has been handled
+                if (frameId) lastEventId = frameId;
               }
-            } catch (e) {
-              console.error("Error parsing SSE data:", e);
             }
           }
+          if (!finished) throw new Error("Stream ended before completion");
+        } catch (error) {
+          if (!lastEventId || attempt >= MAX_STREAM_RETRIES) throw error;
+          await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
         }
       }
     } catch (error) {
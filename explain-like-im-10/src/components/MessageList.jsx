@@ -46,6 +46,20 @@ export default function MessageList({ activeChat, messagesEndRef, handleAudioPla
             </div>
           )}
 
+          {m.audio_urls && ["Explanation", "Example", "Question", "Feedback"]
+            .filter(section => m.audio_urls[section])
+            .map(section => (
+              <div key={section} className="assistant-section audio" style={{ marginBottom: "16px", marginTop: "16px" }}>
+                <strong>{section}:</strong>
+                <audio
+                  controls
+                  src={`${import.meta.env.VITE_API_URL}${m.audio_urls[section]}`}
+                  style={{ width: "100%" }}
+                  onPlay={handleAudioPlay}
+                />
+              </div>
+            ))}
+
           {m.audio_url && (
             <div className="assistant-section audio" style={{ marginBottom: "16px", marginTop: "16px" }}>
               <audio